@@ -18,45 +18,65 @@ logger = logging.getLogger(__name__)
 
 # Add startup logging
 logger.info("=== API SERVER STARTUP ===")
-logger.info(f"Python version: {sys.version}")
-logger.info(f"Working directory: {os.getcwd()}")
-logger.info(f"Python path: {sys.path[:3]}...")  # First 3 entries
-logger.info(f"Environment: {os.getenv('ENVIRONMENT', 'unknown')}")
-logger.info(f"Virtual env: {os.getenv('VIRTUAL_ENV', 'none')}")
+logger.info("Python version: %s", sys.version)
+logger.info("Working directory: %s", os.getcwd())
+logger.info("Python path: %s...", sys.path[:3])  # First 3 entries
+logger.info("Environment: %s", os.getenv('ENVIRONMENT', 'unknown'))
+logger.info("Virtual env: %s", os.getenv('VIRTUAL_ENV', 'none'))
 
 try:
     import uvicorn
     logger.info("Successfully imported uvicorn")
 except Exception as e:
-    logger.error(f"Failed to import uvicorn: {e}")
+    logger.error("Failed to import uvicorn: %s", e)
     sys.exit(1)
 
 try:
     from fastapi import FastAPI, HTTPException, BackgroundTasks, Request, Response
     from fastapi.middleware.cors import CORSMiddleware
-    from fastapi.responses import JSONResponse
+    from fastapi.responses import ORJSONResponse, StreamingResponse
+    from starlette.datastructures import MutableHeaders
+    from starlette.types import ASGIApp, Message, Receive, Scope, Send
+    import anyio  # Ships with Starlette; used to run blocking agent calls in worker threads
     logger.info("Successfully imported FastAPI components")
 except Exception as e:
-    logger.error(f"Failed to import FastAPI: {e}")
+    logger.error("Failed to import FastAPI: %s", e)
     sys.exit(1)
 
 try:
-    from pydantic import BaseModel, Field
-    from typing import Dict, Any, Optional, List
+    import orjson  # Rust-backed JSON encoder used by ORJSONResponse
+    logger.info("Successfully imported orjson")
+except Exception as e:
+    logger.error("Failed to import orjson: %s", e)
+    sys.exit(1)
+
+# Optional: MessagePack bodies for the large visualization payloads (JSON only without it)
+try:
+    import ormsgpack
+    MSGPACK_AVAILABLE = True
+except ImportError:
+    ormsgpack = None
+    MSGPACK_AVAILABLE = False
+
+try:
+    from pydantic import BaseModel, ConfigDict, Field
+    from typing import Dict, Any, Optional, List, Literal
     from datetime import datetime, timedelta
     import json
-    from neo4j.time import DateTime as Neo4jDateTime
+    from neo4j.time import DateTime as Neo4jDateTime, Date as Neo4jDate, Time as Neo4jTime, Duration as Neo4jDuration
+    from neo4j.graph import Node as Neo4jNode, Relationship as Neo4jRelationship, Path as Neo4jPath
+    from neo4j.spatial import Point as Neo4jPoint
     from contextlib import asynccontextmanager
     import ipaddress  # Add this import for IP validation
     import asyncio
     import hashlib
-    from functools import lru_cache
+    from functools import lru_cache, partial
     import httpx  # Add to call external geolocation API
     import re     # Add for matching queries
     import time
     logger.info("Successfully imported standard libraries")
 except Exception as e:
-    logger.error(f"Failed to import standard libraries: {e}")
+    logger.error("Failed to import standard libraries: %s", e)
     sys.exit(1)
 
 # Suppress warnings before importing the agent
@@ -69,28 +89,35 @@ warnings.filterwarnings("ignore", category=UserWarning)
 # Add current directory to path so we can import the agent
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-try:
-    from intelligent_agent import IntelligentSecurityAgent
-    AGENT_IMPORT_SUCCESS = True
-    logger.info("Successfully imported IntelligentSecurityAgent")
-except Exception as e:
-    logger.error(f"Failed to import IntelligentSecurityAgent: {e}")
-    AGENT_IMPORT_SUCCESS = False
-    # Create a dummy class so the server can still start
-    class IntelligentSecurityAgent:
-        def __init__(self, *args, **kwargs):
-            raise Exception("Agent not available - import failed")
+# The agent module pulls in LangChain, sentence-transformers and torch. Import it on first
+# use (from the worker thread that builds the agent) so importing api_server stays cheap
+# and the HTTP port opens before the heavy imports run.
+_agent_class = None
+AGENT_IMPORT_ERROR = None
+
+def load_agent_class():
+    """Import IntelligentSecurityAgent once; returns None if the import failed."""
+    global _agent_class, AGENT_IMPORT_ERROR
+    if _agent_class is None and AGENT_IMPORT_ERROR is None:
+        try:
+            from intelligent_agent import IntelligentSecurityAgent
+            _agent_class = IntelligentSecurityAgent
+            logger.info("Successfully imported IntelligentSecurityAgent")
+        except Exception as e:
+            logger.error("Failed to import IntelligentSecurityAgent: %s", e)
+            AGENT_IMPORT_ERROR = str(e)
+    return _agent_class
 
 # Import Neo4j driver for direct database queries  
 try:
-    from neo4j import GraphDatabase
+    from neo4j import AsyncGraphDatabase
     NEO4J_IMPORT_SUCCESS = True
-    logger.info("Successfully imported Neo4j GraphDatabase")
+    logger.info("Successfully imported Neo4j AsyncGraphDatabase")
 except Exception as e:
-    logger.error(f"Failed to import Neo4j: {e}")
+    logger.error("Failed to import Neo4j: %s", e)
     NEO4J_IMPORT_SUCCESS = False
     # Create a dummy class
-    class GraphDatabase:
+    class AsyncGraphDatabase:
         @staticmethod
         def driver(*args, **kwargs):
             raise Exception("Neo4j not available - import failed")
@@ -103,6 +130,22 @@ MAX_CACHE_SIZE = 100
 # Request deduplication - prevent duplicate processing
 PROCESSING_REQUESTS = {}
 
+# Hot-path invariants hoisted to module level so handlers don't rebuild them per request
+# Validated by pydantic-core on the request model; ANALYSIS_DISPATCH is keyed by these values
+AnalysisType = Literal["auto", "semantic", "graph", "hybrid"]
+SEMANTIC_DATABASES = frozenset(("milvus", "milvus_multi_collection", "milvus_fallback"))
+GRAPH_DATABASES = frozenset(("neo4j", "neo4j_fallback"))
+HISTORY_ROLE_LABELS = {
+    "user": "User", "human": "User",
+    "assistant": "Assistant", "ai": "Assistant", "bot": "Assistant",
+    "system": "System"
+}
+HISTORY_MAX_MESSAGES = 6  # Last 3 exchanges
+HISTORY_MAX_MESSAGE_CHARS = 300
+CACHEABLE_METHODS = frozenset(("GET", "HEAD"))
+INITIALIZING_AGENT_STATUSES = frozenset(("not_initialized", "initialized_but_null"))
+DATABASE_PENDING_KEYWORDS = ("Failed to connect", "timeout", "connection", "unreachable")
+
 # Query optimization patterns
 SIMPLE_QUERIES = {
     # Empty dictionary - removed static data as database is live
@@ -154,7 +197,7 @@ def get_cached_result(cache_key: str) -> Optional[Dict[str, Any]]:
         cached_item = ANALYZE_CACHE[cache_key]
         # Check if cache is still valid (within expiry time)
         if datetime.now() - cached_item['timestamp'] < timedelta(minutes=CACHE_EXPIRY_MINUTES):
-            logger.info(f"Cache hit for key: {cache_key[:8]}...")
+            logger.debug("Cache hit for key: %.8s...", cache_key)
             return cached_item['result']
         else:
             # Remove expired entry
@@ -175,7 +218,7 @@ def cache_result(cache_key: str, result: Dict[str, Any]) -> None:
         'result': result,
         'timestamp': datetime.now()
     }
-    logger.info(f"Cached result for key: {cache_key[:8]}...")
+    logger.debug("Cached result for key: %.8s...", cache_key)
 
 def is_request_processing(cache_key: str) -> bool:
     """Check if this request is already being processed (deduplication)."""
@@ -197,99 +240,239 @@ def cleanup_stale_processing() -> None:
     for key in stale_keys:
         del PROCESSING_REQUESTS[key]
 
+# API timestamps only need second resolution, so a background task refreshes a shared
+# ISO string once per second instead of every response formatting its own
+_current_timestamp = datetime.now().isoformat(timespec="seconds")
+
+def current_timestamp() -> str:
+    """Return the current time as a second-resolution ISO 8601 string."""
+    return _current_timestamp
+
+async def refresh_current_timestamp():
+    """Keep the shared response timestamp up to date."""
+    global _current_timestamp
+    while True:
+        _current_timestamp = datetime.now().isoformat(timespec="seconds")
+        await asyncio.sleep(1)
+
+# Static JSON bodies are serialized once with this placeholder and stamped per request
+_TIMESTAMP_PLACEHOLDER = b"__TIMESTAMP__"
+
+def json_etag(body: bytes, weak: bool = False) -> str:
+    """ETag for an encoded JSON body.
+    
+    Tags hashed over a timestamp template must be weak: the bytes actually sent differ
+    from second to second, so only semantic equivalence is promised.
+    """
+    tag = f'"{hashlib.blake2b(body, digest_size=8).hexdigest()}"'
+    return f"W/{tag}" if weak else tag
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Whether the client's If-None-Match already names this ETag (weak comparison, as
+    RFC 9110 requires for If-None-Match)."""
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    opaque_tag = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") in (opaque_tag, "*") for tag in if_none_match.split(","))
+
+def timestamped_json_response(template: bytes, request: Optional[Request] = None, etag: Optional[str] = None) -> Response:
+    """Return a pre-serialized JSON body with the current timestamp filled in.
+    
+    When an etag is given it is a weak tag taken over the template, so it stays stable as
+    the timestamp ticks; a client already holding it gets an empty 304 instead of the body.
+    """
+    if etag is None:
+        headers = None
+    elif request is not None and etag_matches(request, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    else:
+        headers = {"ETag": etag}
+    return Response(
+        content=template.replace(_TIMESTAMP_PLACEHOLDER, current_timestamp().encode()),
+        media_type="application/json",
+        headers=headers
+    )
+
+def history_cache_key(conversation_history: List["ConversationMessage"]) -> tuple:
+    """Reduce the last few messages to (role, content) pairs usable as an lru_cache key.
+    
+    Only the window that ends up in the prompt is touched, however long the history is
+    (handles both "content" and "message" keys from the frontend).
+    """
+    return tuple(
+        (msg.role, msg.content or msg.message)
+        for msg in conversation_history[-HISTORY_MAX_MESSAGES:]
+    )
+
 @lru_cache(maxsize=50)
-def process_conversation_history_cached(history_hash: str, history_json: str) -> str:
-    """Cached conversation history processing."""
+def process_conversation_history_cached(messages: tuple) -> str:
+    """Cached conversation history processing.
+    
+    Takes the recent window as hashable (role, content) pairs - see history_cache_key().
+    """
     try:
-        history = json.loads(history_json)
-        if not history or len(history) == 0:
-            return ""
-        
-        context_messages = []
-        # Take last 3 exchanges (6 messages max) for better context
-        recent_messages = history[-6:]
-        
-        for msg in recent_messages:
-            # Handle different message formats from custom frontend
-            role = msg.get("role", "").lower()
-            content = msg.get("content", "") or msg.get("message", "")
-            
-            if not content:
-                continue
-                
-            # Clean and format the content
-            content = content.strip()
-            if len(content) > 300:  # Increase limit for better context
-                content = content[:300] + "..."
-            
-            # Map roles to consistent format
-            if role in ["user", "human"]:
-                context_messages.append(f"User: {content}")
-            elif role in ["assistant", "ai", "bot"]:
-                context_messages.append(f"Assistant: {content}")
-            elif role == "system":
-                context_messages.append(f"System: {content}")
+        # Map roles to consistent labels and bound each message's length
+        max_chars = HISTORY_MAX_MESSAGE_CHARS
+        context_messages = [
+            f"{label}: {content if len(content) <= max_chars else content[:max_chars] + '...'}"
+            for role, raw_content in messages
+            if (label := HISTORY_ROLE_LABELS.get((role or "").lower()))
+            and (content := (raw_content or "").strip())
+        ]
         
         if context_messages:
             return "Previous conversation:\n" + "\n".join(context_messages) + "\n\nCurrent question: "
         return ""
     except Exception as e:
-        logger.error(f"Error processing conversation history: {e}")
+        logger.error("Error processing conversation history: %s", e)
         return ""
 
-def serialize_neo4j_objects(obj):
-    """Convert Neo4j objects to JSON-serializable formats."""
-    if isinstance(obj, Neo4jDateTime):
-        return obj.isoformat()
-    elif isinstance(obj, dict):
-        return {key: serialize_neo4j_objects(value) for key, value in obj.items()}
-    elif isinstance(obj, list):
-        return [serialize_neo4j_objects(item) for item in obj]
-    elif hasattr(obj, '__dict__'):
-        # Handle other Neo4j objects by converting to dict
-        try:
-            return serialize_neo4j_objects(obj.__dict__)
-        except:
-            return str(obj)
-    else:
-        return obj
+def _neo4j_node_to_dict(node: Neo4jNode) -> Dict[str, Any]:
+    return {"id": node.element_id, "labels": list(node.labels), "properties": dict(node)}
+
+def _neo4j_relationship_to_dict(relationship: Neo4jRelationship) -> Dict[str, Any]:
+    start_node, end_node = relationship.nodes
+    return {
+        "id": relationship.element_id,
+        "type": relationship.type,
+        "start": start_node.element_id if start_node is not None else None,
+        "end": end_node.element_id if end_node is not None else None,
+        "properties": dict(relationship)
+    }
 
-async def process_source_documents_async(source_documents: List, max_results: int) -> List[Dict[str, Any]]:
-    """Asynchronously process source documents for better performance."""
-    source_docs = []
+def _neo4j_path_to_dict(path: Neo4jPath) -> Dict[str, Any]:
+    return {"nodes": list(path.nodes), "relationships": list(path.relationships)}
+
+def _neo4j_point_to_dict(point: Neo4jPoint) -> Dict[str, Any]:
+    return {"srid": point.srid, "coordinates": list(point)}
+
+# Explicit converters for the Neo4j result types, keyed by type. Converters may return
+# dicts/lists (e.g. node properties); orjson calls back into orjson_default for anything
+# nested inside them.
+_NEO4J_CONVERTERS = {
+    Neo4jDateTime: Neo4jDateTime.iso_format,
+    Neo4jDate: Neo4jDate.iso_format,
+    Neo4jTime: Neo4jTime.iso_format,
+    Neo4jDuration: Neo4jDuration.iso_format,
+    Neo4jNode: _neo4j_node_to_dict,
+    Neo4jRelationship: _neo4j_relationship_to_dict,
+    Neo4jPath: _neo4j_path_to_dict,
+    Neo4jPoint: _neo4j_point_to_dict,
+}
+# Resolved converter per concrete type (None = not a Neo4j type), filled lazily via the MRO
+# so subclasses such as WGS84Point or relationship types resolve once and then hit the fast path
+_converter_by_type: Dict[type, Any] = {}
+
+def _resolve_converter(obj_type: type):
+    """Find the registered Neo4j converter for a type, walking its MRO once."""
+    try:
+        return _converter_by_type[obj_type]
+    except KeyError:
+        pass
+    converter = None
+    for base in obj_type.__mro__:
+        converter = _NEO4J_CONVERTERS.get(base)
+        if converter is not None:
+            break
+    _converter_by_type[obj_type] = converter
+    return converter
+
+def orjson_default(obj):
+    """orjson fallback for values it can't encode natively.
     
-    async def process_single_doc(doc):
-        try:
-            # Serialize metadata to handle Neo4j objects
-            serialized_metadata = serialize_neo4j_objects(doc.metadata)
-            
-            # Clean and limit content size for API response
-            content = str(doc.page_content)
-            if len(content) > 1500:  # Reasonable limit for frontend display
-                content = content[:1500] + "... [truncated]"
-            
-            # Remove problematic characters
-            content = content.replace('\x00', '').replace('\r\n', '\n').replace('\r', '\n')
-            
-            return {
-                "content": content,
-                "metadata": serialized_metadata,
-                "score": getattr(doc, 'score', None)  # Include similarity score if available
-            }
-        except Exception as e:
-            logger.error(f"Error processing source document: {e}")
-            return None
+    Metadata is handed to orjson as-is, so Neo4j values are converted here, at encode
+    time, instead of by a Python walk over every document; orjson calls back in for
+    anything nested inside the converted value.
+    """
+    converter = _NEO4J_CONVERTERS.get(type(obj)) or _resolve_converter(type(obj))
+    if converter is not None:
+        return converter(obj)
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    attributes = getattr(obj, '__dict__', None)
+    if type(attributes) is dict:
+        return attributes
+    return str(obj)
+
+# Non-string dict keys and numpy values show up in retriever metadata
+ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+class APIJSONResponse(ORJSONResponse):
+    """ORJSONResponse that also encodes Neo4j values, numpy scalars and non-string keys."""
     
-    # Process documents concurrently
-    tasks = [process_single_doc(doc) for doc in source_documents[:max_results]]
-    results = await asyncio.gather(*tasks, return_exceptions=True)
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, default=orjson_default, option=ORJSON_OPTIONS)
+
+JSON_MEDIA_TYPE = "application/json"
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+MSGPACK_OPTIONS = (ormsgpack.OPT_NON_STR_KEYS | ormsgpack.OPT_SERIALIZE_NUMPY) if MSGPACK_AVAILABLE else 0
+
+def negotiated_media_type(request: Request) -> str:
+    """MessagePack when the client accepts it and ormsgpack is installed, JSON otherwise."""
+    if MSGPACK_AVAILABLE and MSGPACK_MEDIA_TYPE in request.headers.get("accept", ""):
+        return MSGPACK_MEDIA_TYPE
+    return JSON_MEDIA_TYPE
+
+def encode_body(content: Any, media_type: str) -> bytes:
+    """Encode a response payload as JSON or MessagePack, with the same fallbacks for both."""
+    if media_type == MSGPACK_MEDIA_TYPE:
+        return ormsgpack.packb(content, default=orjson_default, option=MSGPACK_OPTIONS)
+    return orjson.dumps(content, default=orjson_default, option=ORJSON_OPTIONS)
+
+def negotiated_response(request: Request, content: Any) -> Response:
+    """Encode content in the format the client asked for (see negotiated_media_type)."""
+    media_type = negotiated_media_type(request)
+    return Response(content=encode_body(content, media_type), media_type=media_type)
+
+def model_json_response(model: BaseModel) -> APIJSONResponse:
+    """Encode a response model directly instead of through FastAPI's jsonable_encoder."""
+    return APIJSONResponse(model.model_dump())
+
+# Single-pass cleanup for document content: drop NULs, turn lone carriage returns into newlines
+_CONTENT_TRANSLATION = str.maketrans({'\x00': None, '\r': '\n'})
+
+def _serialize_source_document(page_content, metadata: Dict[str, Any]) -> Dict[str, Any]:
+    """Truncate and clean document content; metadata is encoded by orjson_default."""
+    # Clean and limit content size for API response
+    content = str(page_content)
+    if len(content) > 1500:  # Reasonable limit for frontend display
+        content = content[:1500] + "... [truncated]"
     
-    # Filter out None results and exceptions
-    for result in results:
-        if result is not None and not isinstance(result, Exception):
-            source_docs.append(result)
+    # Remove problematic characters (CRLF first so it becomes one newline, not two). The
+    # `in` checks are memchr scans; translate() maps character by character, so it only
+    # runs for the rare content that actually contains \r or NUL
+    if '\r' in content:
+        content = content.replace('\r\n', '\n').translate(_CONTENT_TRANSLATION)
+    elif '\x00' in content:
+        content = content.translate(_CONTENT_TRANSLATION)
     
-    return source_docs
+    return {
+        "content": content,
+        "metadata": metadata
+    }
+
+def serialize_source_document(doc) -> Dict[str, Any]:
+    """Serialize a retrieved document for the API response."""
+    serialized = _serialize_source_document(doc.page_content, doc.metadata)
+    serialized["score"] = getattr(doc, 'score', None)  # Include similarity score if available
+    return serialized
+
+def try_serialize_source_document(doc) -> Optional[Dict[str, Any]]:
+    """Serialize one document, logging and skipping it (None) if it can't be serialized."""
+    try:
+        return serialize_source_document(doc)
+    except Exception as e:
+        logger.error("Error processing source document: %s", e)
+        return None
+
+def serialize_source_documents(source_documents, max_results: int) -> List[Dict[str, Any]]:
+    """Serialize up to max_results documents for the API response in one comprehension."""
+    return [
+        serialized
+        for serialized in map(try_serialize_source_document, source_documents[:max_results])
+        if serialized is not None
+    ]
 
 # Configuration class for better management
 class Config:
@@ -300,19 +483,36 @@ class Config:
         self.api_port = int(os.getenv("API_PORT", "8000"))
         self.log_level = os.getenv("LOG_LEVEL", "INFO").upper()
         self.environment = os.getenv("ENVIRONMENT", "development")
-        self.cors_origins = os.getenv("CORS_ORIGINS", "*").split(",")
+        # Parse CORS origins once; credentials can't be combined with a wildcard origin
+        self.cors_origins = [origin.strip() for origin in os.getenv("CORS_ORIGINS", "*").split(",") if origin.strip()] or ["*"]
+        self.cors_allow_credentials = "*" not in self.cors_origins
+        if not self.cors_allow_credentials:
+            logger.warning("CORS_ORIGINS contains '*' - disabling CORS credentials")
         self.lightweight_mode = os.getenv("LIGHTWEIGHT_MODE", "false").lower() == "true"
+        self.workers = int(os.getenv("WEB_CONCURRENCY", "1"))
+        self.agent_threads = int(os.getenv("AGENT_THREADS", "16"))
+        # Agent calls run in worker threads, so this timeout really fires (it never did while
+        # the LLM call blocked the loop). Keep it well above a normal LLM answer; a timed-out
+        # thread runs on and holds its AGENT_THREADS slot until the call returns.
+        self.analysis_timeout = float(os.getenv("ANALYSIS_TIMEOUT_SECONDS", "120"))
+        # Per-request access logging and X-Forwarded-* parsing cost throughput; opt in when needed
+        self.access_log = os.getenv("ACCESS_LOG", "false").lower() == "true"
+        self.proxy_headers = os.getenv("PROXY_HEADERS", "false").lower() == "true"
         
         # Add Neo4j configuration
         self.neo4j_uri = os.getenv("NEO4J_URI", "bolt://localhost:7687")
         self.neo4j_user = os.getenv("NEO4J_USER", "neo4j")
         self.neo4j_password = os.getenv("NEO4J_PASSWORD", "password123")  # Fixed: was empty string
+        # Naming the database up front saves a home-database resolution round trip per session
+        self.neo4j_database = os.getenv("NEO4J_DATABASE", "neo4j")
         
         # Validate configuration
         if self.api_port < 1 or self.api_port > 65535:
             raise ValueError(f"Invalid API port: {self.api_port}")
+        if self.workers < 1:
+            raise ValueError(f"Invalid WEB_CONCURRENCY: {self.workers}")
         
-        logger.info(f"Configuration loaded - Host: {self.api_host}, Port: {self.api_port}, Environment: {self.environment}")
+        logger.info("Configuration loaded - Host: %s, Port: %s, Environment: %s", self.api_host, self.api_port, self.environment)
 
 config = Config()
 
@@ -321,12 +521,292 @@ agent = None
 agent_initialized = False
 initialization_error = None
 
-# Neo4j helper class for direct visualization queries
+# Driver connection pool shared by all visualization queries
+NEO4J_MAX_POOL_SIZE = 50
+# execute_read retries transient failures (including an unreachable server) with backoff
+# until this budget is spent. The visualization reads are read-only and polled by the
+# dashboard, so they get a single attempt: a down server errors immediately and the next
+# poll is the retry.
+NEO4J_MAX_TRANSACTION_RETRY_SECONDS = 0.0
+# Records pulled per round trip while iterating a result; bounds memory on large scans
+NEO4J_FETCH_SIZE = 1000
+
+# Cypher used by the visualization helper and /network/stats. Kept as constant, fully
+# parameterized statements so Neo4j's plan cache (keyed on query text) gets reused.
+
+# Hosts around one IP address and their flows. Each direction is anchored on the Host(ip)
+# uniqueness index and limited on its own; an OR across both hosts cannot use the index
+# and expands every flow before the LIMIT.
+CYPHER_NETWORK_GRAPH_FOR_IP = """
+CALL {
+    MATCH (src:Host {ip: $ip_address})-[:SENT]->(f:Flow)-[:USES_DST_PORT]->(:Port),
+          (dst:Host)-[:RECEIVED]->(f)
+    RETURN src, dst, f
+    LIMIT $limit
+    UNION
+    MATCH (dst:Host {ip: $ip_address})-[:RECEIVED]->(f:Flow)-[:USES_DST_PORT]->(:Port),
+          (src:Host)-[:SENT]->(f)
+    RETURN src, dst, f
+    LIMIT $limit
+}
+WITH src, dst, f
+LIMIT $limit
+
+WITH collect(DISTINCT {
+    id: src.ip,
+    type: "host",
+    label: src.ip,
+    group: CASE WHEN src.ip = $ip_address THEN "source_host" ELSE "dest_host" END,
+    ip: src.ip,
+    malicious: coalesce(f.malicious, false)
+}) as source_nodes,
+
+collect(DISTINCT {
+    id: dst.ip,
+    type: "host", 
+    label: dst.ip,
+    group: CASE WHEN dst.ip = $ip_address THEN "source_host" ELSE "dest_host" END,
+    ip: dst.ip,
+    malicious: coalesce(f.malicious, false)
+}) as dest_nodes,
+
+collect(DISTINCT {
+    source: src.ip,
+    target: dst.ip,
+    type: "FLOW",
+    weight: 1
+}) as host_links
+
+RETURN source_nodes + dest_nodes as nodes,
+       host_links as links
+"""
+
+# General network overview - hosts only, no ports
+CYPHER_NETWORK_GRAPH_OVERVIEW = """
+MATCH (src:Host)-[:SENT]->(f:Flow)-[:USES_DST_PORT]->(dst_port:Port),
+      (dst:Host)-[:RECEIVED]->(f)
+WHERE (f.malicious IS NULL OR f.malicious = false) 
+  AND (f.honeypot IS NULL OR f.honeypot = false)
+WITH src, dst, f
+LIMIT $limit
+
+WITH collect(DISTINCT {
+    id: src.ip,
+    type: "host",
+    label: src.ip,
+    group: "source_host",
+    ip: src.ip,
+    malicious: coalesce(f.malicious, false)
+}) as source_nodes,
+
+collect(DISTINCT {
+    id: dst.ip,
+    type: "host",
+    label: dst.ip, 
+    group: "dest_host",
+    ip: dst.ip,
+    malicious: coalesce(f.malicious, false)
+}) as dest_nodes,
+
+collect(DISTINCT {
+    source: src.ip,
+    target: dst.ip,
+    type: "FLOW",
+    weight: 1
+}) as host_links
+
+RETURN source_nodes + dest_nodes as nodes,
+       host_links as links
+"""
+
+# All /network/stats figures in one round trip: basic counts (including malicious flows in
+# the total), then port and protocol distributions with actual flow counts, each in its
+# own CALL subquery
+CYPHER_NETWORK_STATS = """
+CALL {
+    MATCH (src:Host)-[:SENT]->(f:Flow)-[:USES_DST_PORT]->(dst_port:Port),
+          (dst:Host)-[:RECEIVED]->(f)
+    RETURN count(f) as total_flows,
+           sum(CASE WHEN f.malicious = true THEN 1 ELSE 0 END) as malicious_count,
+           count(CASE WHEN (f.malicious IS NULL OR f.malicious = false) AND (f.honeypot IS NULL OR f.honeypot = false) THEN 1 END) as active_count
+}
+CALL {
+    MATCH (h:Host)
+    RETURN count(h) as total_hosts
+}
+CALL {
+    MATCH (f:Flow)-[:USES_DST_PORT]->(dst_port:Port)
+    WHERE (f.malicious IS NULL OR f.malicious = false) 
+      AND (f.honeypot IS NULL OR f.honeypot = false)
+    WITH dst_port.port as port, coalesce(dst_port.service, 'unknown') as service, count(f) as flow_count
+    ORDER BY flow_count DESC
+    LIMIT 10
+    RETURN collect({port: port, service: service, count: flow_count}) as top_ports
+}
+CALL {
+    MATCH (f:Flow)-[:USES_PROTOCOL]->(proto:Protocol)
+    WHERE (f.malicious IS NULL OR f.malicious = false) 
+      AND (f.honeypot IS NULL OR f.honeypot = false)
+    WITH proto.name as protocol, count(f) as flow_count
+    ORDER BY flow_count DESC
+    LIMIT 10
+    RETURN collect({protocol: protocol, count: flow_count}) as top_protocols
+}
+RETURN total_flows, total_hosts, malicious_count, active_count, top_ports, top_protocols
+"""
+
+async def _read_single(tx, query: str, params: Optional[dict] = None):
+    """Read transaction function returning the query's single record."""
+    result = await tx.run(query, params or {})
+    return await result.single()
+
+async def _read_data(tx, query: str, params: Optional[dict] = None) -> List[Dict[str, Any]]:
+    """Read transaction function returning all records as dicts."""
+    result = await tx.run(query, params or {})
+    return await result.data()
+
+# /visualization/bar-chart: top 10 per chart type as {name, value}, with each row's share of
+# the top-10 total computed server-side
+_CYPHER_BAR_CHART_PERCENTAGES = """
+WITH collect({name: name, value: value}) as rows, sum(value) as total
+RETURN [row IN rows | row {.*, percentage: round(100.0 * row.value / total, 1)}] as data, total
+"""
+
+CYPHER_BAR_CHARTS = {
+    "protocols": """
+        MATCH (f:Flow)-[:USES_PROTOCOL]->(p:Protocol)
+        WITH p.name as name, count(f) as value
+        ORDER BY value DESC
+        LIMIT 10
+    """ + _CYPHER_BAR_CHART_PERCENTAGES,
+    "ports": """
+        MATCH (f:Flow)-[:USES_DST_PORT]->(port:Port)
+        WITH toString(port.port) + " (" + coalesce(port.service, "unknown") + ")" as name, count(f) as value
+        ORDER BY value DESC
+        LIMIT 10
+    """ + _CYPHER_BAR_CHART_PERCENTAGES,
+    "threats": """
+        MATCH (src:Host)-[:SENT]->(f:Flow)
+        WHERE f.malicious = true
+        WITH src.ip as name, count(f) as value
+        ORDER BY value DESC
+        LIMIT 10
+    """ + _CYPHER_BAR_CHART_PERCENTAGES,
+    "countries": """
+        MATCH (h:Host)-[:SENT]->(f:Flow)
+        WHERE h.country IS NOT NULL AND h.country <> ""
+        WITH h.country as name, count(f) as value
+        ORDER BY value DESC
+        LIMIT 10
+    """ + _CYPHER_BAR_CHART_PERCENTAGES,
+}
+
+# /visualization/time-series: one query per metric with the optional IP filter spliced in
+# here, so each (metric, filter) pair is a fixed text that Neo4j plans once and reuses.
+# alerts and threats share a text and differ only in $severity_threshold.
+_CYPHER_TIME_SERIES_IP_FILTERS = {
+    "none": "",
+    "source_and_dest": "AND f.sourceIPv4Address = $source_ip AND f.destinationIPv4Address = $dest_ip",
+    "source_or_dest": "AND (f.sourceIPv4Address = $source_ip OR f.destinationIPv4Address = $source_ip)",
+}
+_CYPHER_TIME_SERIES_WINDOW = """
+    WHERE datetime(f.flowStartMilliseconds) >= datetime($start_time)
+        AND datetime(f.flowStartMilliseconds) <= datetime($end_time)
+        AND (f.malicious IS NULL OR f.malicious = false)
+        AND (f.honeypot IS NULL OR f.honeypot = false)
+        {ip_filter}
+"""
+_CYPHER_TIME_SERIES_ALERTS = """
+    MATCH (src:Host)-[:SENT]->(f:Flow)-[:USES_DST_PORT]->(dst_port:Port)
+""" + _CYPHER_TIME_SERIES_WINDOW + """
+    WITH 
+        f.flowStartMilliseconds as timestamp,
+        size(collect(DISTINCT dst_port.port)) as num_ports,
+        sum(coalesce(f.octetTotalCount, 0)) as bytes,
+        sum(coalesce(f.reverseOctetTotalCount, 0)) as reverse_bytes,
+        sum(coalesce(f.packetTotalCount, 0)) as packets
+    WHERE bytes > 0 AND reverse_bytes > 0
+    WITH 
+        timestamp,
+        num_ports,
+        bytes / reverse_bytes as pcr,
+        packets / bytes as por
+    WHERE pcr > 0 AND por > 0
+    WITH 
+        timestamp,
+        1 / (1 + exp(-(0.00243691 * num_ports + 0.00014983 * pcr + 0.00014983 * por - 3.93433105))) as alert_prob
+    WHERE alert_prob >= $severity_threshold
+    RETURN timestamp, count(*) as value
+    ORDER BY timestamp
+"""
+_CYPHER_TIME_SERIES_TEMPLATES = {
+    "bandwidth": """
+    MATCH (f:Flow)
+""" + _CYPHER_TIME_SERIES_WINDOW + """
+    RETURN 
+        f.flowStartMilliseconds as timestamp,
+        coalesce(f.octetTotalCount, 0) + coalesce(f.reverseOctetTotalCount, 0) as value
+    ORDER BY timestamp
+""",
+    "flows": """
+    MATCH (f:Flow)
+""" + _CYPHER_TIME_SERIES_WINDOW + """
+    RETURN 
+        f.flowStartMilliseconds as timestamp,
+        count(*) as value
+    ORDER BY timestamp
+""",
+    "alerts": _CYPHER_TIME_SERIES_ALERTS,
+    "threats": _CYPHER_TIME_SERIES_ALERTS,
+}
+CYPHER_TIME_SERIES = {
+    (metric, filter_name): template.format(ip_filter=ip_filter)
+    for metric, template in _CYPHER_TIME_SERIES_TEMPLATES.items()
+    for filter_name, ip_filter in _CYPHER_TIME_SERIES_IP_FILTERS.items()
+}
+TIME_SERIES_SEVERITY_THRESHOLDS = {"alerts": 0.1, "threats": 0.6}
+
+# /visualization/heatmap, keyed by heatmap_type
+CYPHER_HEATMAPS = {
+    # Bucket flows by (day, hour) in Cypher; only the timestamp is carried past the
+    # WITH, so no Flow rows are materialized
+    "hourly_activity": """
+        MATCH (f:Flow)
+        WHERE f.flowStartMilliseconds IS NOT NULL
+        WITH datetime({epochMillis: f.flowStartMilliseconds}) as dt
+        RETURN dt.dayOfWeek - 1 as day_index, dt.hour as hour, count(*) as value
+    """,
+    # Top source IPs vs destination ports
+    "ip_port_matrix": """
+        MATCH (src:Host)-[:SENT]->(f:Flow)-[:USES_DST_PORT]->(port:Port)
+        WITH src.ip as ip, port.port as port, count(f) as flow_count
+        ORDER BY flow_count DESC
+        LIMIT 100
+        RETURN ip, port, flow_count as value
+    """,
+    # Geographic threat intensity by region
+    "threat_intensity": """
+        MATCH (h:Host)-[:SENT]->(f:Flow)
+        WHERE h.country IS NOT NULL AND f.malicious = true
+        WITH h.country as region, count(f) as threats
+        ORDER BY threats DESC
+        RETURN region, threats as value
+    """,
+}
+
+# /visualization/bar-chart/bundle: the dashboard's default charts in one round trip, one
+# row per chart_type via UNION ALL over the same per-chart queries.
+BAR_CHART_BUNDLE_TYPES = ("protocols", "ports", "threats")
+CYPHER_BAR_CHART_BUNDLE = "\nUNION ALL\n".join(
+    f"CALL {{{CYPHER_BAR_CHARTS[chart_type]}}}\nRETURN '{chart_type}' as chart_type, data, total"
+    for chart_type in BAR_CHART_BUNDLE_TYPES
+)
+
+# Neo4j helper class for direct visualization queries. Uses the async driver so Bolt
+# round trips release the event loop instead of blocking every other request.
 class Neo4jVisualizationHelper:
     def __init__(self):
         self.driver = None
-        self.session_pool = None
-        self.max_pool_size = 10
         self.query_cache = {}
         self.cache_ttl = timedelta(minutes=5)
         self.query_stats = {}
@@ -342,65 +822,30 @@ class Neo4jVisualizationHelper:
                     logger.warning("Neo4j import failed - visualization features unavailable")
                     return False
                 
-                # Configure connection pooling
-                self.driver = GraphDatabase.driver(
+                # Configure connection pooling; the driver pools connections itself and
+                # sessions are cheap, short-lived handles opened per query
+                self.driver = AsyncGraphDatabase.driver(
                     config.neo4j_uri,
                     auth=(config.neo4j_user, config.neo4j_password),
                     max_connection_lifetime=30 * 60,  # 30 minutes
-                    max_connection_pool_size=self.max_pool_size,
-                    connection_acquisition_timeout=2.0  # 2 seconds timeout
+                    max_connection_pool_size=NEO4J_MAX_POOL_SIZE,
+                    max_transaction_retry_time=NEO4J_MAX_TRANSACTION_RETRY_SECONDS,
+                    connection_acquisition_timeout=2.0,  # 2 seconds timeout
+                    fetch_size=NEO4J_FETCH_SIZE
                 )
                 
-                # Initialize session pool
-                self.session_pool = []
-                for _ in range(self.max_pool_size):
-                    session = self.driver.session()
-                    self.session_pool.append({
-                        'session': session,
-                        'in_use': False,
-                        'last_used': datetime.now()
-                    })
-                
                 logger.info("Successfully connected to Neo4j with connection pooling")
                 return True
             except Exception as e:
-                logger.error(f"Failed to connect to Neo4j: {e}")
+                logger.error("Failed to connect to Neo4j: %s", e)
                 return False
         return True
     
-    async def get_session(self):
-        """Get an available session from the pool."""
-        try:
-            # First try to find an unused session
-            for session_data in self.session_pool:
-                if not session_data['in_use']:
-                    session_data['in_use'] = True
-                    session_data['last_used'] = datetime.now()
-                    return session_data['session']
-            
-            # If all sessions are in use, wait briefly and try again
-            await asyncio.sleep(0.1)
-            for session_data in self.session_pool:
-                if not session_data['in_use']:
-                    session_data['in_use'] = True
-                    session_data['last_used'] = datetime.now()
-                    return session_data['session']
-            
-            # If still no session available, create a new one
-            logger.warning("All sessions in use, creating temporary session")
-            return self.driver.session()
-            
-        except Exception as e:
-            logger.error(f"Error getting Neo4j session: {e}")
-            raise
-    
-    def release_session(self, session):
-        """Release a session back to the pool."""
-        for session_data in self.session_pool:
-            if session_data['session'] == session:
-                session_data['in_use'] = False
-                session_data['last_used'] = datetime.now()
-                return
+    def session(self):
+        """Open a session on the configured database; the driver is created at startup."""
+        if self.driver is None:
+            raise RuntimeError("Neo4j helper not initialized")
+        return self.driver.session(database=config.neo4j_database)
     
     async def execute_cached_query(self, query: str, params: dict = None, cache_key: str = None) -> Any:
         """Execute a Neo4j query with caching and connection pooling."""
@@ -417,22 +862,16 @@ class Neo4jVisualizationHelper:
                 return cache_entry['result']
         
         try:
-            # Get session from pool
-            session = await self.get_session()
-            
-            try:
+            async with self.session() as session:
                 # Execute query with timeout
-                start_time = time.time()
-                result = await asyncio.wait_for(
-                    session.run(query, params or {}),
+                start_time = time.perf_counter()
+                data = await asyncio.wait_for(
+                    session.execute_read(_read_data, query, params),
                     timeout=10.0  # 10 second timeout
                 )
                 
-                # Process results
-                data = await result.data()
-                
                 # Update query statistics
-                execution_time = time.time() - start_time
+                execution_time = time.perf_counter() - start_time
                 if query not in self.query_stats:
                     self.query_stats[query] = {
                         'count': 0,
@@ -452,15 +891,11 @@ class Neo4jVisualizationHelper:
                 
                 return data
                 
-            finally:
-                # Always release the session back to the pool
-                self.release_session(session)
-                
         except asyncio.TimeoutError:
-            logger.error(f"Query timeout: {query[:100]}...")
+            logger.error("Query timeout: %s...", query[:100])
             raise HTTPException(status_code=504, detail="Database query timed out")
         except Exception as e:
-            logger.error(f"Error executing Neo4j query: {e}")
+            logger.error("Error executing Neo4j query: %s", e)
             raise HTTPException(status_code=500, detail="Database query failed")
     
     async def check_health(self) -> bool:
@@ -470,128 +905,37 @@ class Neo4jVisualizationHelper:
             return True
             
         try:
-            session = await self.get_session()
-            try:
-                result = await session.run("RETURN 1")
-                await result.single()
-                self.last_health_check = datetime.now()
-                return True
-            finally:
-                self.release_session(session)
+            await self.driver.verify_connectivity()
+            self.last_health_check = datetime.now()
+            return True
         except Exception as e:
-            logger.error(f"Neo4j health check failed: {e}")
+            logger.error("Neo4j health check failed: %s", e)
             return False
     
-    def close(self):
+    async def close(self):
         """Close all database connections."""
         try:
-            # Close all sessions in the pool
-            for session_data in self.session_pool:
-                try:
-                    session_data['session'].close()
-                except Exception as e:
-                    logger.error(f"Error closing session: {e}")
-            
-            # Close the driver
             if self.driver:
-                self.driver.close()
+                await self.driver.close()
                 
             logger.info("Successfully closed all Neo4j connections")
         except Exception as e:
-            logger.error(f"Error closing Neo4j connections: {e}")
+            logger.error("Error closing Neo4j connections: %s", e)
 
-    def get_network_graph_data(self, limit: int = 100, ip_address: Optional[str] = None) -> Dict[str, Any]:
+    async def get_network_graph_data(self, limit: int = 100, ip_address: Optional[str] = None) -> Dict[str, Any]:
         """Get network graph data from Neo4j for visualization."""
         try:
-            logger.info(f"Querying Neo4j for network graph data - limit: {limit}, ip_address: {ip_address}")
+            logger.debug("Querying Neo4j for network graph data - limit: %s, ip_address: %s", limit, ip_address)
             
-            if not self.driver:
-                logger.error("Neo4j driver not connected")
-                raise Exception("Neo4j driver not connected")
-            
-            with self.driver.session() as session:
+            async with self.session() as session:
                 if ip_address:
                     # Query for specific IP address and its connections - hosts only
-                    query = """
-                    MATCH (src:Host)-[:SENT]->(f:Flow)-[:USES_DST_PORT]->(dst_port:Port),
-                          (dst:Host)-[:RECEIVED]->(f)
-                    WHERE src.ip = $ip_address OR dst.ip = $ip_address
-                    WITH src, dst, f
-                    LIMIT $limit
-                    
-                    WITH collect(DISTINCT {
-                        id: src.ip,
-                        type: "host",
-                        label: src.ip,
-                        group: CASE WHEN src.ip = $ip_address THEN "source_host" ELSE "dest_host" END,
-                        ip: src.ip,
-                        malicious: coalesce(f.malicious, false)
-                    }) as source_nodes,
-                    
-                    collect(DISTINCT {
-                        id: dst.ip,
-                        type: "host", 
-                        label: dst.ip,
-                        group: CASE WHEN dst.ip = $ip_address THEN "source_host" ELSE "dest_host" END,
-                        ip: dst.ip,
-                        malicious: coalesce(f.malicious, false)
-                    }) as dest_nodes,
-                    
-                    collect(DISTINCT {
-                        source: src.ip,
-                        target: dst.ip,
-                        type: "FLOW",
-                        weight: 1
-                    }) as host_links
-                    
-                    RETURN source_nodes + dest_nodes as nodes,
-                           host_links as links
-                    """
-                    
-                    result = session.run(query, {"ip_address": ip_address, "limit": limit})
-                    
+                    query, params = CYPHER_NETWORK_GRAPH_FOR_IP, {"ip_address": ip_address, "limit": limit}
                 else:
                     # Query for general network overview - hosts only, no ports
-                    query = """
-                    MATCH (src:Host)-[:SENT]->(f:Flow)-[:USES_DST_PORT]->(dst_port:Port),
-                          (dst:Host)-[:RECEIVED]->(f)
-                    WHERE (f.malicious IS NULL OR f.malicious = false) 
-                      AND (f.honeypot IS NULL OR f.honeypot = false)
-                    WITH src, dst, f
-                    LIMIT $limit
-                    
-                    WITH collect(DISTINCT {
-                        id: src.ip,
-                        type: "host",
-                        label: src.ip,
-                        group: "source_host",
-                        ip: src.ip,
-                        malicious: coalesce(f.malicious, false)
-                    }) as source_nodes,
-                    
-                    collect(DISTINCT {
-                        id: dst.ip,
-                        type: "host",
-                        label: dst.ip, 
-                        group: "dest_host",
-                        ip: dst.ip,
-                        malicious: coalesce(f.malicious, false)
-                    }) as dest_nodes,
-                    
-                    collect(DISTINCT {
-                        source: src.ip,
-                        target: dst.ip,
-                        type: "FLOW",
-                        weight: 1
-                    }) as host_links
-                    
-                    RETURN source_nodes + dest_nodes as nodes,
-                           host_links as links
-                    """
-                    
-                    result = session.run(query, {"limit": limit})
+                    query, params = CYPHER_NETWORK_GRAPH_OVERVIEW, {"limit": limit}
                 
-                record = result.single()
+                record = await session.execute_read(_read_single, query, params)
                 
                 if not record:
                     logger.warning("No network data found in Neo4j")
@@ -601,36 +945,46 @@ class Neo4jVisualizationHelper:
                         "message": "No network data available in the database"
                     }
                 
-                # Convert Neo4j results to NetworkNode/NetworkLink format
+                # Shape rows as plain dicts matching the NetworkNode/NetworkLink schema; orjson
+                # encodes them directly, so no per-row model validation is needed
                 nodes_data = record["nodes"] or []
                 links_data = record["links"] or []
                 
-                # Convert to the format expected by the API
-                nodes = []
+                # A host can come back once per role and per distinct malicious value; keep one
+                # node per id and flag it malicious if any of its flows were. Both graph queries
+                # build host maps with every key below (malicious already coalesced), so rows are
+                # indexed directly; hosts carry no port or service.
+                nodes_by_id = {}
                 for node_data in nodes_data:
-                    node = NetworkNode(
-                        id=node_data["id"],
-                        type=node_data["type"],
-                        label=node_data["label"],
-                        group=node_data["group"],
-                        ip=node_data.get("ip"),
-                        port=node_data.get("port"),
-                        service=node_data.get("service"),
-                        malicious=node_data.get("malicious", False)
-                    )
-                    nodes.append(node)
+                    node_id = node_data["id"]
+                    malicious = node_data["malicious"]
+                    node = nodes_by_id.get(node_id)
+                    if node is None:
+                        nodes_by_id[node_id] = {
+                            "id": node_id,
+                            "type": node_data["type"],
+                            "label": node_data["label"],
+                            "group": node_data["group"],
+                            "ip": node_data["ip"],
+                            "port": None,
+                            "protocol": None,
+                            "service": None,
+                            "malicious": malicious,
+                            "metadata": None
+                        }
+                    elif malicious:
+                        node["malicious"] = True
+                nodes = list(nodes_by_id.values())
                 
-                links = []
-                for link_data in links_data:
-                    link = NetworkLink(
-                        source=link_data["source"],
-                        target=link_data["target"],
-                        type=link_data["type"],
-                        weight=link_data.get("weight", 1)
-                    )
-                    links.append(link)
+                links = [{
+                    "source": link_data["source"],
+                    "target": link_data["target"],
+                    "type": link_data["type"],
+                    "weight": link_data["weight"],
+                    "metadata": None
+                } for link_data in links_data]
                 
-                logger.info(f"Retrieved {len(nodes)} nodes and {len(links)} links from Neo4j")
+                logger.debug("Retrieved %d nodes and %d links from Neo4j", len(nodes), len(links))
                 
                 return {
                     "nodes": nodes,
@@ -638,7 +992,7 @@ class Neo4jVisualizationHelper:
                 }
                 
         except Exception as e:
-            logger.error(f"Error retrieving network graph data: {e}")
+            logger.error("Error retrieving network graph data: %s", e)
             raise
 
 # Initialize Neo4j helper for visualization
@@ -646,14 +1000,16 @@ try:
     neo4j_helper = Neo4jVisualizationHelper()
     logger.info("Neo4j helper initialized")
 except Exception as e:
-    logger.error(f"Failed to initialize Neo4j helper: {e}")
+    logger.error("Failed to initialize Neo4j helper: %s", e)
     # Create a dummy helper
     class DummyNeo4jHelper:
         def connect(self): 
             return False
-        def close(self): 
+        async def close(self): 
             pass
-        def get_network_graph_data(self, *args, **kwargs):
+        def session(self):
+            raise Exception("Neo4j unavailable")
+        async def get_network_graph_data(self, *args, **kwargs):
             return {"nodes": [], "links": [], "message": "Neo4j unavailable"}
     neo4j_helper = DummyNeo4jHelper()
 
@@ -662,7 +1018,7 @@ try:
     agent_manager = AgentManager()
     logger.info("Agent manager initialized")
 except Exception as e:
-    logger.error(f"Failed to initialize agent manager: {e}")
+    logger.error("Failed to initialize agent manager: %s", e)
     # Create a dummy manager
     class DummyAgentManager:
         def __init__(self):
@@ -683,7 +1039,7 @@ STATS_CACHE_EXPIRY_MINUTES = 5
 
 # Improved caching with TTL and async updates
 class CacheManager:
-    def __init__(self, expiry_minutes: int = 5):
+    def __init__(self, expiry_minutes: float = 5):
         self.cache = {}
         self.expiry_minutes = expiry_minutes
         self.locks = {}
@@ -750,6 +1106,11 @@ class CacheManager:
 network_stats_cache = CacheManager(expiry_minutes=STATS_CACHE_EXPIRY_MINUTES)
 analyze_cache = CacheManager(expiry_minutes=CACHE_EXPIRY_MINUTES)
 
+# Dashboards poll /network/stats and /network/graph far more often than the graph changes,
+# so their encoded response bodies are kept briefly and repeat polls skip Neo4j and orjson
+NETWORK_RESPONSE_CACHE_TTL_SECONDS = 5.0
+network_response_cache = CacheManager(expiry_minutes=NETWORK_RESPONSE_CACHE_TTL_SECONDS / 60)
+
 # Enhance cache management with TTL and size-based eviction
 class QueryCache:
     def __init__(self, max_size=1000, ttl_minutes=30):
@@ -853,13 +1214,13 @@ class AggressiveQueryCache:
         if query in self.primary_cache:
             entry = self.primary_cache[query]
             if now - entry['timestamp'] < self.primary_ttl:
-                logger.info(f"Primary cache hit for query: {query[:50]}...")
+                logger.debug("Primary cache hit for query: %.50s...", query)
                 return entry['data']
         
         # 2. Check pattern cache
         for pattern, result in self.pattern_cache.items():
             if re.search(pattern, query):
-                logger.info(f"Pattern cache hit for query: {query[:50]}...")
+                logger.debug("Pattern cache hit for query: %.50s...", query)
                 return result['data']
         
         # 3. Check secondary cache with similarity matching
@@ -874,7 +1235,7 @@ class AggressiveQueryCache:
                     best_match = entry
         
         if best_match:
-            logger.info(f"Secondary cache hit (similarity: {best_similarity:.2f}) for query: {query[:50]}...")
+            logger.debug("Secondary cache hit (similarity: %.2f) for query: %.50s...", best_similarity, query)
             return best_match['data']
         
         return None
@@ -945,15 +1306,41 @@ class AggressiveQueryCache:
 # Initialize aggressive cache
 aggressive_cache = AggressiveQueryCache()
 
+# Retriever references of the current agent, captured once when it is created
+NO_AGENT_CAPABILITIES = {"milvus": None, "neo4j": None, "hybrid": None, "collections": None}
+
 class AgentManager:
     def __init__(self):
         self.agent = None
+        self.capabilities = NO_AGENT_CAPABILITIES
+        self.collections_response_template = None  # /collections body, built on first request
         self.initialized = False
         self.initialization_error = None
         self.initialization_lock = asyncio.Lock()
         self.last_health_check = None
         self.health_check_interval = timedelta(minutes=5)
     
+    def _set_agent(self, agent):
+        """Store a new agent and snapshot the retrievers it exposes for /health and /collections."""
+        self.agent = agent
+        milvus_retriever = agent.milvus_retriever
+        self.capabilities = {
+            "milvus": milvus_retriever,
+            "neo4j": agent.neo4j_retriever,
+            "hybrid": agent.hybrid_retriever,
+            # Only the multi-collection retriever has collections
+            "collections": getattr(milvus_retriever, 'collections', None),
+        }
+        self.collections_response_template = None
+    
+    @staticmethod
+    def _create_agent():
+        """Build the agent; connects to Milvus/Neo4j and loads models, so run it in a worker thread."""
+        return load_agent_class()(
+            neo4j_database=config.neo4j_database,
+            collection_name=None  # Use multi-collection retriever
+        )
+    
     async def initialize(self):
         """Initialize the agent with resilient error handling."""
         if self.initialized and self.agent:
@@ -968,7 +1355,7 @@ class AgentManager:
                 logger.info("Initializing Intelligent Security Agent...")
                 
                 # Check if agent import was successful
-                if not AGENT_IMPORT_SUCCESS:
+                if await anyio.to_thread.run_sync(load_agent_class) is None:
                     logger.warning("Agent import failed - marking as initialized with limited functionality")
                     self.agent = None
                     self.initialized = True
@@ -978,9 +1365,7 @@ class AgentManager:
                 # IMPROVED: More resilient initialization - attempt connection but don't fail completely
                 # if databases are temporarily unavailable
                 try:
-                    self.agent = IntelligentSecurityAgent(
-                        collection_name=None  # Use multi-collection retriever
-                    )
+                    self._set_agent(await anyio.to_thread.run_sync(self._create_agent))
                     self.initialized = True
                     self.initialization_error = None
                     logger.info("Agent initialized successfully with full database connectivity!")
@@ -988,7 +1373,7 @@ class AgentManager:
                     
                 except Exception as db_error:
                     # If database connection fails, still mark as initialized but with limited functionality
-                    logger.warning(f"Database connection failed during initialization: {db_error}")
+                    logger.warning("Database connection failed during initialization: %s", db_error)
                     logger.info("Agent will retry database connections on first query")
                     
                     # Create a minimal agent instance that can handle basic operations
@@ -999,7 +1384,7 @@ class AgentManager:
                     return None  # Return None but don't fail the health check
                     
             except Exception as e:
-                logger.error(f"Critical error during agent initialization: {e}")
+                logger.error("Critical error during agent initialization: %s", e)
                 self.initialized = False
                 self.initialization_error = f"Critical initialization error: {str(e)}"
                 return None
@@ -1012,16 +1397,20 @@ class AgentManager:
         
         # If initialization was attempted but failed due to database issues, retry
         if self.initialized and not self.agent and "Database connection pending" in str(self.initialization_error):
-            logger.info("Retrying database connections...")
-            try:
-                self.agent = IntelligentSecurityAgent(collection_name=None)
-                self.initialization_error = None
-                logger.info("Database connections established successfully!")
-                return self.agent
-            except Exception as e:
-                logger.warning(f"Database retry failed: {e}")
-                # Keep the pending status
-                return None
+            # Construction yields to the event loop now, so serialize retries on the init lock
+            async with self.initialization_lock:
+                if self.agent:
+                    return self.agent
+                logger.info("Retrying database connections...")
+                try:
+                    self._set_agent(await anyio.to_thread.run_sync(self._create_agent))
+                    self.initialization_error = None
+                    logger.info("Database connections established successfully!")
+                    return self.agent
+                except Exception as e:
+                    logger.warning("Database retry failed: %s", e)
+                    # Keep the pending status
+                    return None
         
         # If not initialized at all, try full initialization
         if not self.initialized:
@@ -1043,50 +1432,56 @@ class AgentManager:
             if not self.agent:
                 return False
             
-            # Check Milvus connection
-            if hasattr(self.agent, 'milvus_retriever'):
-                if not self.agent.milvus_retriever or not self.agent.milvus_retriever.client:
-                    return False
-            
-            # Check Neo4j connection
-            if hasattr(self.agent, 'neo4j_retriever'):
-                if not self.agent.neo4j_retriever or not self.agent.neo4j_retriever.driver:
-                    return False
-            
-            return True
+            # Both retrievers must have come up (the Neo4j one with a live driver)
+            neo4j_retriever = self.agent.neo4j_retriever
+            return (
+                self.agent.milvus_retriever is not None
+                and neo4j_retriever is not None
+                and neo4j_retriever.driver is not None
+            )
         except Exception as e:
-            logger.error(f"Health check failed: {e}")
+            logger.error("Health check failed: %s", e)
             return False
     
     def close(self):
         """Close all agent connections."""
         if self.agent:
             try:
-                if hasattr(self.agent, 'milvus_retriever'):
-                    if hasattr(self.agent.milvus_retriever, 'client'):
-                        self.agent.milvus_retriever.client.close()
-                
-                if hasattr(self.agent, 'neo4j_retriever'):
-                    if hasattr(self.agent.neo4j_retriever, 'driver'):
-                        self.agent.neo4j_retriever.driver.close()
-                
+                # The agent closes its own Neo4j driver
                 self.agent.close()
                 logger.info("Agent connections closed successfully")
             except Exception as e:
-                logger.error(f"Error closing agent: {e}")
+                logger.error("Error closing agent: %s", e)
             finally:
                 self.agent = None
+                self.capabilities = NO_AGENT_CAPABILITIES
+                self.collections_response_template = None
                 self.initialized = False
 
 # Initialize agent manager
 agent_manager = AgentManager()
 
+# Upper bound on each blocking close() during shutdown
+SHUTDOWN_CLOSE_TIMEOUT_SECONDS = 5
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Manage application lifespan with proper resource handling."""
     # Startup
     logger.info("Starting up Mistral Security Analysis API")
     
+    # Blocking agent queries run in anyio's worker threads; size the pool for concurrent LLM calls
+    anyio.to_thread.current_default_thread_limiter().total_tokens = config.agent_threads
+    
+    timestamp_task = asyncio.create_task(refresh_current_timestamp())
+    await start_rate_limiter_cleanup()
+    # Creating the driver does no I/O (connections open lazily), so it is safe in every
+    # startup mode and the visualization endpoints never need to connect on demand
+    if not neo4j_helper.connect():
+        logger.warning("Neo4j visualization helper unavailable - graph endpoints will return errors")
+    stats_refresh_task = None
+    init_task = None
+    
     try:
         # Check environment - in CI/CD, always start immediately
         is_ci_cd = os.getenv("CI", "false").lower() == "true" or os.getenv("GITLAB_CI", "false").lower() == "true"
@@ -1114,27 +1509,35 @@ async def lifespan(app: FastAPI):
                             else:
                                 logger.info("⚠️ Database connections pending - will retry on first query")
                         except Exception as e:
-                            logger.warning(f"Background database initialization failed: {e}")
+                            logger.warning("Background database initialization failed: %s", e)
                     except Exception as e:
-                        logger.error(f"Background init task failed: {e}")
+                        logger.error("Background init task failed: %s", e)
                 
                 # Start background task only if not in CI/CD
                 asyncio.create_task(background_init())
         else:
             logger.info("🚀 Attempting full initialization with database connections...")
-            try:
-                agent = await agent_manager.initialize()
-                if agent:
-                    logger.info("✅ Full initialization completed - all systems ready!")
-                else:
-                    logger.info("⚠️ Database connections pending - will retry on first query")
-            except Exception as e:
-                logger.warning(f"Database initialization warning: {e}")
-                logger.info("⚠️ API server will start with degraded functionality")
+            # Keep the "network_stats" cache used by optimized queries warm
+            stats_refresh_task = asyncio.create_task(refresh_network_stats_cache())
+            
+            async def full_init():
+                try:
+                    agent = await agent_manager.initialize()
+                    if agent:
+                        logger.info("✅ Full initialization completed - all systems ready!")
+                    else:
+                        logger.info("⚠️ Database connections pending - will retry on first query")
+                except Exception as e:
+                    logger.warning("Database initialization warning: %s", e)
+                    logger.info("⚠️ API server will start with degraded functionality")
+            
+            # Initialize in the background so the port opens immediately; queries that
+            # arrive meanwhile wait on the agent manager's initialization lock
+            init_task = asyncio.create_task(full_init())
     
     except Exception as e:
         # Never let startup fail - just log the error and continue
-        logger.error(f"Startup error (non-fatal): {e}")
+        logger.error("Startup error (non-fatal): %s", e)
         logger.info("🚀 API server starting with minimal functionality")
     
     # Always log that we're ready - this helps with deployment monitoring
@@ -1143,33 +1546,64 @@ async def lifespan(app: FastAPI):
     yield
     
     # Shutdown
+    timestamp_task.cancel()
+    if stats_refresh_task:
+        stats_refresh_task.cancel()
+    if init_task and not init_task.done():
+        init_task.cancel()
+    await stop_rate_limiter_cleanup()
     try:
         logger.info("Shutting down Mistral Security Analysis API")
+        # Teardown is bounded rather than allowed to stall container termination; the
+        # agent's sync drivers block, so they are closed in a worker thread
         try:
-            agent_manager.close()
+            with anyio.fail_after(SHUTDOWN_CLOSE_TIMEOUT_SECONDS):
+                await anyio.to_thread.run_sync(agent_manager.close, abandon_on_cancel=True)
+        except TimeoutError:
+            logger.warning("Timed out closing agent manager")
         except Exception as e:
-            logger.error(f"Error closing agent manager: {e}")
+            logger.error("Error closing agent manager: %s", e)
         
         try:
-            neo4j_helper.close()
+            with anyio.fail_after(SHUTDOWN_CLOSE_TIMEOUT_SECONDS):
+                await neo4j_helper.close()
+        except TimeoutError:
+            logger.warning("Timed out closing neo4j helper")
         except Exception as e:
-            logger.error(f"Error closing neo4j helper: {e}")
+            logger.error("Error closing neo4j helper: %s", e)
         
         logger.info("Shutdown complete")
     except Exception as e:
-        logger.error(f"Shutdown error: {e}")
+        logger.error("Shutdown error: %s", e)
 
 # Pydantic models for API requests/responses with improved validation
+class ConversationMessage(BaseModel):
+    # Frozen like the request it belongs to; unknown keys from the frontend are ignored
+    model_config = ConfigDict(frozen=True)
+    
+    role: Optional[str] = Field(default=None, description="user, assistant, system (or human, ai, bot)")
+    content: Optional[str] = Field(default=None, description="Message text")
+    message: Optional[str] = Field(default=None, description="Older clients send the text as message")
+
 class SecurityQueryRequest(BaseModel):
+    # Immutable; unknown keys from older clients are ignored (pydantic's default)
+    model_config = ConfigDict(frozen=True)
+    
     query: str = Field(..., description="Security question or analysis request", min_length=1, max_length=2000)
-    analysis_type: str = Field(default="auto", description="Type of analysis: auto, semantic, graph, or hybrid")
+    analysis_type: AnalysisType = Field(default="auto", description="Type of analysis: auto, semantic, graph, or hybrid")
     include_sources: bool = Field(default=True, description="Whether to include source documents")
     max_results: int = Field(default=10, description="Maximum number of source documents", ge=1, le=50)
     user: str = Field(default="anonymous", description="User making the request", max_length=100)
     timestamp: Optional[str] = Field(default=None, description="Request timestamp")
-    conversation_history: Optional[List[Dict[str, str]]] = Field(default=None, description="Previous conversation messages for context")
+    conversation_history: Optional[List[ConversationMessage]] = Field(default=None, description="Previous conversation messages for context")
 
+# Response models are built with model_construct() on the hot path: every field is
+# produced server-side (our own strings, floats and serialized metadata), so running
+# the validators again is pure overhead. Only untrusted input (SecurityQueryRequest)
+# goes through full validation.
 class SecurityQueryResponse(BaseModel):
+    model_config = ConfigDict(frozen=True)
+    
     result: str
     query_type: str
     database_used: str
@@ -1231,6 +1665,14 @@ class NetworkStatsResponse(BaseModel):
     success: bool = True
     error: Optional[str] = None
 
+# Responses smaller than this are sent uncompressed
+COMPRESSION_MINIMUM_SIZE = 1024
+# zlib level 5: close to level 9's ratio on JSON at roughly half the CPU (Starlette defaults to 9)
+GZIP_COMPRESS_LEVEL = 5
+# Brotli quality 4 compresses JSON better than gzip -5 at similar cost; higher levels are
+# meant for static assets compressed once, not per-response compression
+BROTLI_QUALITY = 4
+
 # Configure FastAPI with optimized settings
 app = FastAPI(
     title="Security Analysis API",
@@ -1239,57 +1681,138 @@ app = FastAPI(
     docs_url="/api/docs",
     redoc_url="/api/redoc",
     openapi_url="/api/openapi.json",
+    default_response_class=APIJSONResponse,  # orjson is much faster for large source_documents payloads
     lifespan=lifespan  # Add the lifespan context manager
 )
 
-# Configure CORS with optimized settings
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],  # Configure this based on your needs
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-    max_age=3600  # Cache preflight requests for 1 hour
-)
+# Minimal CORS for the allow-all policy. Starlette's CORSMiddleware does per-request
+# origin matching and builds a Headers object for every request; with "*" and no
+# credentials the answer is always the same, so the headers are precomputed.
+class WildcardCORSMiddleware:
+    """Pure ASGI CORS middleware for CORS_ORIGINS="*"."""
+
+    def __init__(self, app: ASGIApp, allow_methods: tuple, allow_headers: tuple, max_age: int):
+        self.app = app
+        self.allow_methods = frozenset(method.encode("latin-1") for method in allow_methods)
+        self.preflight_headers = [
+            (b"access-control-allow-origin", b"*"),
+            (b"access-control-allow-methods", ", ".join(allow_methods).encode("latin-1")),
+            (b"access-control-allow-headers", ", ".join(allow_headers).encode("latin-1")),
+            (b"access-control-max-age", str(max_age).encode("latin-1")),
+        ]
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
 
-# Add GZip compression middleware
+        origin = request_method = None
+        for name, value in scope["headers"]:
+            if name == b"origin":
+                origin = value
+            elif name == b"access-control-request-method":
+                request_method = value
+
+        # Not a CORS request
+        if origin is None:
+            await self.app(scope, receive, send)
+            return
+
+        if scope["method"] == "OPTIONS" and request_method is not None:
+            await self.preflight_response(request_method, send)
+            return
+
+        async def send_with_cors(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                message.setdefault("headers", []).append((b"access-control-allow-origin", b"*"))
+            await send(message)
+
+        await self.app(scope, receive, send_with_cors)
+
+    async def preflight_response(self, request_method: bytes, send: Send) -> None:
+        if request_method not in self.allow_methods:
+            status, body = 400, b"Disallowed CORS method"
+        else:
+            status, body = 200, b"OK"
+        headers = [
+            *self.preflight_headers,
+            (b"content-type", b"text/plain; charset=utf-8"),
+            (b"content-length", str(len(body)).encode("latin-1")),
+        ]
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        await send({"type": "http.response.body", "body": body})
+
+CORS_ALLOW_METHODS = ("GET", "POST")  # The only methods the API serves
+CORS_ALLOW_HEADERS = ("content-type", "authorization")  # Accept is CORS-safelisted already
+CORS_MAX_AGE = 86400  # Cache preflight requests for 24 hours (browsers may cap this lower)
+
+# Add response compression middleware - Brotli when available (falls back to gzip for
+# clients without "br"), plain GZip otherwise. The 1 KB floor keeps /health uncompressed.
 from fastapi.middleware.gzip import GZipMiddleware
-app.add_middleware(GZipMiddleware, minimum_size=1000)
+try:
+    from brotli_asgi import BrotliMiddleware
+    app.add_middleware(
+        BrotliMiddleware,
+        quality=BROTLI_QUALITY,
+        mode="text",  # Tunes the encoder for UTF-8 JSON
+        minimum_size=COMPRESSION_MINIMUM_SIZE,
+        gzip_fallback=True
+    )
+    logger.info("Brotli response compression enabled")
+except Exception as e:
+    logger.warning("Brotli unavailable, using GZip compression: %s", e)
+    app.add_middleware(GZipMiddleware, minimum_size=COMPRESSION_MINIMUM_SIZE, compresslevel=GZIP_COMPRESS_LEVEL)
 
-# Add custom timing and caching middleware
-@app.middleware("http")
-async def add_timing_and_cache_control(request: Request, call_next):
+# Add custom timing and caching middleware. Written as a pure ASGI class rather than
+# @app.middleware("http"): BaseHTTPMiddleware builds Request/Response objects and runs
+# call_next in an extra anyio task for every request.
+class ASGITimingMiddleware:
     """Add response timing and cache control headers."""
-    start_time = time.time()
-    
-    # Get cache configuration for this path
-    cache_config = get_cache_config(request.url.path)
-    
-    # Check if we should return cached response
-    if cache_config['cacheable'] and request.method in ["GET", "HEAD"]:
-        cached_response = await get_cached_response(request)
-        if cached_response:
-            return cached_response
-    
-    # Process the request
-    response = await call_next(request)
-    
-    # Add timing header
-    process_time = time.time() - start_time
-    response.headers["X-Process-Time"] = str(process_time)
-    
-    # Add cache control headers
-    if cache_config['cacheable']:
-        response.headers["Cache-Control"] = (
-            f"public, max-age={cache_config['max_age']}, "
-            f"stale-while-revalidate={cache_config['stale_while_revalidate']}"
-        )
-        if cache_config.get('vary'):
-            response.headers["Vary"] = cache_config['vary']
-    else:
-        response.headers["Cache-Control"] = "no-store"
-    
-    return response
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start_time = time.perf_counter()
+        path = scope["path"]
+
+        # Get cache configuration for this path
+        cache_config = get_cache_config(path)
+
+        # Check if we should return cached response
+        if cache_config['cacheable'] and scope["method"] in CACHEABLE_METHODS:
+            cached_response = await get_cached_response(path, scope["query_string"])
+            if cached_response:
+                await cached_response(scope, receive, send)
+                return
+
+        # Cache control headers
+        if cache_config['cacheable']:
+            cache_control = (
+                f"public, max-age={cache_config['max_age']}, "
+                f"stale-while-revalidate={cache_config['stale_while_revalidate']}"
+            )
+            vary = cache_config.get('vary')
+        else:
+            cache_control = "no-store"
+            vary = None
+
+        async def send_with_headers(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                headers["X-Process-Time"] = str(time.perf_counter() - start_time)
+                headers["Cache-Control"] = cache_control
+                if vary:
+                    headers["Vary"] = vary
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
+
+app.add_middleware(ASGITimingMiddleware)
 
 # Cache configuration for different endpoints
 CACHE_CONFIGS = {
@@ -1303,13 +1826,19 @@ CACHE_CONFIGS = {
         "cacheable": True,
         "max_age": 300,
         "stale_while_revalidate": 60,
+        "vary": "Accept-Encoding, Accept"  # JSON or MessagePack by Accept
+    },
+    "/examples": {
+        "cacheable": True,
+        "max_age": 3600,  # static apart from the timestamp
+        "stale_while_revalidate": 60,
         "vary": "Accept-Encoding"
     },
     "/visualization/": {
         "cacheable": True,
         "max_age": 3600,  # 1 hour
         "stale_while_revalidate": 300,
-        "vary": "Accept-Encoding"
+        "vary": "Accept-Encoding, Accept"
     }
 }
 
@@ -1335,7 +1864,7 @@ app.add_middleware(TrustedHostMiddleware, allowed_hosts=["*"])
 
 # Add custom rate limiting
 from datetime import datetime, timedelta
-from collections import defaultdict
+from collections import Counter, defaultdict
 import asyncio
 
 class RateLimiter:
@@ -1385,68 +1914,122 @@ RATE_LIMITERS = {
     "visualization": RateLimiter(50, 60)  # 50 visualization requests per minute
 }
 
-# Start cleanup tasks for rate limiters
-@app.on_event("startup")
+# Rate limiter cleanup tasks are started and stopped by the lifespan handler
 async def start_rate_limiter_cleanup():
     """Start cleanup tasks for rate limiters."""
     for limiter in RATE_LIMITERS.values():
         limiter.cleanup_task = asyncio.create_task(limiter.cleanup())
 
-@app.on_event("shutdown")
 async def stop_rate_limiter_cleanup():
     """Stop rate limiter cleanup tasks."""
     for limiter in RATE_LIMITERS.values():
-        if hasattr(limiter, 'cleanup_task') and limiter.cleanup_task:
+        if limiter.cleanup_task:
             limiter.cleanup_task.cancel()
             try:
                 await limiter.cleanup_task
             except asyncio.CancelledError:
                 pass
 
-@app.middleware("http")
-async def rate_limit_middleware(request: Request, call_next):
+# The 429 body never changes, so it is serialized once. The Response itself is built per
+# request: Starlette sends its raw header list as-is, and header-editing middleware mutates it.
+RATE_LIMIT_EXCEEDED_BODY = orjson.dumps({
+    "error": "Too many requests",
+    "detail": "Rate limit exceeded. Please try again later."
+})
+
+class RateLimitMiddleware:
     """Apply rate limiting to requests."""
-    # Get client identifier (IP address or API key)
-    client_id = request.client.host
-    
-    # Determine which rate limiter to use
-    if request.url.path == "/analyze":
-        limiter = RATE_LIMITERS["analyze"]
-    elif request.url.path.startswith("/visualization"):
-        limiter = RATE_LIMITERS["visualization"]
-    else:
-        limiter = RATE_LIMITERS["default"]
-    
-    # Check rate limit
-    if not await limiter.is_allowed(client_id):
-        return JSONResponse(
-            status_code=429,
-            content={
-                "error": "Too many requests",
-                "detail": "Rate limit exceeded. Please try again later."
-            }
-        )
-    
-    return await call_next(request)
 
-@app.get("/", response_model=dict)
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        # Get client identifier (IP address)
+        client = scope.get("client")
+        client_id = client[0] if client else "unknown"
+
+        # Determine which rate limiter to use
+        path = scope["path"]
+        if path == "/analyze":
+            limiter = RATE_LIMITERS["analyze"]
+        elif path.startswith("/visualization"):
+            limiter = RATE_LIMITERS["visualization"]
+        else:
+            limiter = RATE_LIMITERS["default"]
+
+        # Check rate limit
+        if not await limiter.is_allowed(client_id):
+            response = Response(RATE_LIMIT_EXCEEDED_BODY, status_code=429, media_type="application/json")
+            await response(scope, receive, send)
+            return
+
+        await self.app(scope, receive, send)
+
+app.add_middleware(RateLimitMiddleware)
+
+# Configure CORS - the precomputed wildcard middleware when every origin is allowed,
+# Starlette's origin-matching middleware otherwise. Added last so it is the outermost
+# layer: preflights are answered before rate limiting, timing or compression run, and
+# every response (429s included) gets its CORS headers.
+if config.cors_origins == ["*"]:
+    app.add_middleware(
+        WildcardCORSMiddleware,
+        allow_methods=CORS_ALLOW_METHODS,
+        allow_headers=CORS_ALLOW_HEADERS,
+        max_age=CORS_MAX_AGE
+    )
+else:
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=config.cors_origins,  # From CORS_ORIGINS (comma-separated)
+        allow_credentials=config.cors_allow_credentials,
+        allow_methods=CORS_ALLOW_METHODS,
+        allow_headers=CORS_ALLOW_HEADERS,
+        max_age=CORS_MAX_AGE
+    )
+
+# The root payload is fixed once config is loaded; only "status" varies
+ROOT_PAYLOAD = {
+    "message": "Mistral Security Analysis API",
+    "version": "1.0.0",
+    "environment": config.environment,
+    "docs": "/docs" if config.environment == "development" else "disabled",
+    "health": "/health",
+    "endpoints": {
+        "analyze": "/analyze",
+        "collections": "/collections",
+        "examples": "/examples",
+        "network_graph": "/network/graph",
+        "network_stats": "/network/stats"
+    }
+}
+# Pre-serialized root bodies, keyed by agent_manager.initialized
+ROOT_RESPONSE_BODIES = {
+    True: orjson.dumps({**ROOT_PAYLOAD, "status": "healthy"}),
+    False: orjson.dumps({**ROOT_PAYLOAD, "status": "initializing"}),
+}
+
+@app.get("/")
 async def root():
     """Root endpoint with enhanced information."""
-    return {
-        "message": "Mistral Security Analysis API",
-        "version": "1.0.0",
-        "environment": config.environment,
-        "status": "healthy" if agent_manager.initialized else "initializing",
-        "docs": "/docs" if config.environment == "development" else "disabled",
-        "health": "/health",
-        "endpoints": {
-            "analyze": "/analyze",
-            "collections": "/collections",
-            "examples": "/examples",
-            "network_graph": "/network/graph",
-            "network_stats": "/network/stats"
-        }
-    }
+    return Response(
+        content=ROOT_RESPONSE_BODIES[bool(agent_manager.initialized)],
+        media_type="application/json"
+    )
+
+# Docker probes /healthz constantly; the environment doesn't change, so serialize it once
+HEALTHZ_RESPONSE_TEMPLATE = orjson.dumps({
+    "status": "ok",
+    "service": "mistral-api",
+    "timestamp": _TIMESTAMP_PLACEHOLDER.decode(),
+    "startup_mode": os.getenv("STARTUP_MODE", "normal"),
+    "lightweight_mode": os.getenv("LIGHTWEIGHT_MODE", "false"),
+    "ci_mode": os.getenv("CI", "false")
+})
 
 @app.get("/healthz")
 async def simple_health_check():
@@ -1454,29 +2037,37 @@ async def simple_health_check():
     try:
         # Ultra-simple health check - just return ok if the server is running
         # This is specifically designed to pass Docker health checks quickly
-        return {
-            "status": "ok", 
-            "service": "mistral-api", 
-            "timestamp": datetime.now().isoformat(),
-            "startup_mode": os.getenv("STARTUP_MODE", "normal"),
-            "lightweight_mode": os.getenv("LIGHTWEIGHT_MODE", "false"),
-            "ci_mode": os.getenv("CI", "false")
-        }
+        return timestamped_json_response(HEALTHZ_RESPONSE_TEMPLATE)
     except Exception as e:
         # Even if there's an error, return something so Docker doesn't mark as unhealthy
-        logger.error(f"Health check error: {e}")
+        logger.error("Health check error: %s", e)
         return {
             "status": "error_but_running", 
             "service": "mistral-api", 
             "error": str(e),
-            "timestamp": datetime.now().isoformat()
+            "timestamp": current_timestamp()
         }
 
-@app.get("/health", response_model=HealthResponse)
+LIGHTWEIGHT_DATABASES_STATUS = {
+    "mode": "lightweight_testing",
+    "milvus": "disabled",
+    "neo4j": "disabled",
+    "note": "Start with LIGHTWEIGHT_MODE=false to enable databases"
+}
+
+# Liveness/readiness probes hit /health every few seconds; reuse the last serialized body briefly
+HEALTH_CACHE_TTL_SECONDS = 2.0
+HEALTH_CACHE = {"checked_at": 0.0, "response": None}
+
+@app.get("/health", responses={200: {"model": HealthResponse}})
 async def health_check():
     """Enhanced health check endpoint with Docker-friendly status reporting."""
     global agent, agent_initialized, initialization_error
     
+    now = time.monotonic()
+    if HEALTH_CACHE["response"] is not None and now - HEALTH_CACHE["checked_at"] < HEALTH_CACHE_TTL_SECONDS:
+        return Response(content=HEALTH_CACHE["response"], media_type="application/json")
+    
     # Determine overall agent status
     if config.lightweight_mode:
         agent_status = "lightweight_mode"
@@ -1492,18 +2083,14 @@ async def health_check():
     # Check database connections with detailed status
     databases = {}
     if config.lightweight_mode:
-        databases = {
-            "mode": "lightweight_testing",
-            "milvus": "disabled",
-            "neo4j": "disabled",
-            "note": "Start with LIGHTWEIGHT_MODE=false to enable databases"
-        }
+        databases = LIGHTWEIGHT_DATABASES_STATUS
     elif agent_manager.initialized and agent_manager.agent:
+        capabilities = agent_manager.capabilities
         try:
             # Test Milvus connection
-            if hasattr(agent_manager.agent, 'milvus_retriever') and agent_manager.agent.milvus_retriever:
-                if hasattr(agent_manager.agent.milvus_retriever, 'collections'):
-                    collections = agent_manager.agent.milvus_retriever.collections
+            if capabilities["milvus"]:
+                collections = capabilities["collections"]
+                if collections is not None:
                     databases["milvus"] = f"connected ({len(collections)} collections: {list(collections.keys())})"
                 else:
                     databases["milvus"] = "connected (single collection)"
@@ -1511,20 +2098,14 @@ async def health_check():
                 databases["milvus"] = "not_available"
             
             # Test Neo4j connection  
-            if hasattr(agent_manager.agent, 'neo4j_retriever') and agent_manager.agent.neo4j_retriever:
-                databases["neo4j"] = "connected"
-            else:
-                databases["neo4j"] = "not_available"
+            databases["neo4j"] = "connected" if capabilities["neo4j"] else "not_available"
             
             # Test hybrid retriever
-            if hasattr(agent_manager.agent, 'hybrid_retriever') and agent_manager.agent.hybrid_retriever:
-                databases["hybrid"] = "available"
-            else:
-                databases["hybrid"] = "not_available"
+            databases["hybrid"] = "available" if capabilities["hybrid"] else "not_available"
                 
         except Exception as e:
             databases["error"] = str(e)
-            logger.error(f"Error during health check: {e}")
+            logger.error("Error during health check: %s", e)
     else:
         databases = {"status": "agent_not_initialized"}
         if agent_manager.initialization_error:
@@ -1536,10 +2117,10 @@ async def health_check():
         overall_status = "healthy_lightweight"
     elif agent_status == "healthy" and any("connected" in str(status) for status in databases.values()):
         overall_status = "healthy"
-    elif agent_status in ["not_initialized", "initialized_but_null"]:
+    elif agent_status in INITIALIZING_AGENT_STATUSES:
         # Still initializing but API is responsive - consider healthy for deployment
         overall_status = "healthy_initializing"
-    elif "error" in agent_status and any(keyword in str(agent_manager.initialization_error) for keyword in ["Failed to connect", "timeout", "connection", "unreachable"]):
+    elif "error" in agent_status and any(keyword in str(agent_manager.initialization_error) for keyword in DATABASE_PENDING_KEYWORDS):
         # Database connection issues during startup - API is still functional for basic operations
         overall_status = "healthy_database_pending"
     else:
@@ -1551,13 +2132,15 @@ async def health_check():
     
     # For Docker health checks, return HTTP 200 for all status except critical failures
     # This ensures deployment succeeds even if databases are still connecting
-    return HealthResponse(
+    body = orjson.dumps(HealthResponse.model_construct(
         status=overall_status,
-        timestamp=datetime.now().isoformat(),
+        timestamp=current_timestamp(),
         agent_status=agent_status,
-        databases=databases,
-        overall_status=overall_status
-    )
+        databases=databases
+    ).model_dump())
+    HEALTH_CACHE["checked_at"] = now
+    HEALTH_CACHE["response"] = body
+    return Response(content=body, media_type="application/json")
 
 # Optimize query patterns for dynamic responses (FIXED: Made patterns more specific)
 QUERY_PATTERNS = {
@@ -1582,7 +2165,7 @@ async def is_simple_query(query: str) -> tuple[bool, Optional[Dict[str, Any]]]:
                 if result:
                     return True, result
             except Exception as e:
-                logger.error(f"Error getting optimized response for {query_type}: {e}")
+                logger.error("Error getting optimized response for %s: %s", query_type, e)
     
     return False, None
 
@@ -1644,7 +2227,7 @@ async def get_optimized_response(query_type: str) -> Optional[Dict[str, Any]]:
         return None
         
     except Exception as e:
-        logger.error(f"Error in get_optimized_response for {query_type}: {e}")
+        logger.error("Error in get_optimized_response for %s: %s", query_type, e)
         return None
 
 async def optimize_query(query: str) -> tuple[str, Optional[str]]:
@@ -1658,10 +2241,10 @@ async def optimize_query(query: str) -> tuple[str, Optional[str]]:
         return query, None
         
     except Exception as e:
-        logger.error(f"Error in optimize_query: {e}")
+        logger.error("Error in optimize_query: %s", e)
         return query, None
 
-async def process_parallel_analysis(query: str, agent, analysis_type: str = "auto") -> Dict[str, Any]:
+async def process_parallel_analysis(query: str, agent, analysis_type: AnalysisType = "auto") -> Dict[str, Any]:
     """Process analysis tasks in parallel with optimized execution and respect for analysis type."""
     try:
         # FIXED: Only try optimized query handling if analysis_type is "auto"
@@ -1677,33 +2260,11 @@ async def process_parallel_analysis(query: str, agent, analysis_type: str = "aut
                     'error': None
                 }
         
-        # If not an optimized query or explicit analysis type requested, proceed with analysis
-        tasks = []
-        
-        # FIXED: Respect explicit analysis type requests
-        if analysis_type in ["auto", "semantic", "hybrid"] and hasattr(agent, 'milvus_retriever'):
-            tasks.append(asyncio.create_task(
-                asyncio.wait_for(
-                    semantic_analysis(query, agent),
-                    timeout=8.0  # FIXED: Increased timeout from 3 to 8 seconds
-                )
-            ))
-            
-        if analysis_type in ["auto", "graph", "hybrid"] and hasattr(agent, 'neo4j_retriever'):
-            tasks.append(asyncio.create_task(
-                asyncio.wait_for(
-                    graph_analysis(query, agent),
-                    timeout=6.0  # FIXED: Increased timeout from 2 to 6 seconds
-                )
-            ))
-        
-        # For explicit semantic or graph requests, only run that analysis
-        if analysis_type == "semantic" and len(tasks) > 1:
-            tasks = [tasks[0]]  # Keep only semantic task
-        elif analysis_type == "graph" and len(tasks) > 0:
-            tasks = [tasks[-1]]  # Keep only graph task
-        
-        if not tasks:
+        # If not an optimized query or explicit analysis type requested, proceed with analysis.
+        # Each analysis type issues exactly one agent call, so it is awaited directly
+        # rather than through a task and asyncio.wait.
+        runner, required_retriever = ANALYSIS_DISPATCH.get(analysis_type, (None, None))
+        if runner is None or (required_retriever and getattr(agent, required_retriever) is None):
             return {
                 'result': 'No suitable analysis method available for this query type.',
                 'query_type': 'ERROR',
@@ -1711,29 +2272,10 @@ async def process_parallel_analysis(query: str, agent, analysis_type: str = "aut
                 'error': 'No analysis tasks created'
             }
         
-        # Wait for first successful result (or all results for hybrid)
-        if analysis_type == "hybrid":
-            # For hybrid, wait for all tasks
-            results = await asyncio.gather(*tasks, return_exceptions=True)
-        else:
-            # For auto/semantic/graph, wait for first completion
-            done, pending = await asyncio.wait(
-                tasks,
-                return_when=asyncio.FIRST_COMPLETED
-            )
-            
-            # Cancel remaining tasks
-            for task in pending:
-                task.cancel()
-            
-            # Process results
-            results = []
-            for task in done:
-                try:
-                    result = await task
-                    results.append(result)
-                except Exception as e:
-                    results.append(e)
+        try:
+            results = [await asyncio.wait_for(runner(query, agent), timeout=config.analysis_timeout)]
+        except Exception as e:
+            results = [e]
         
         # Process and return results
         successful_results = []
@@ -1783,7 +2325,7 @@ async def process_parallel_analysis(query: str, agent, analysis_type: str = "aut
         else:
             # All tasks failed or timed out
             error_msg = f"Analysis failed or timed out. Errors: {'; '.join(errors) if errors else 'Unknown error'}"
-            logger.error(f"All analysis tasks failed: {error_msg}")
+            logger.error("All analysis tasks failed: %s", error_msg)
             
             return {
                 'result': 'Analysis failed. Please try again.',
@@ -1794,7 +2336,7 @@ async def process_parallel_analysis(query: str, agent, analysis_type: str = "aut
             }
         
     except Exception as e:
-        logger.error(f"Error in process_parallel_analysis: {e}")
+        logger.error("Error in process_parallel_analysis: %s", e)
         return {
             'result': f'Error processing analysis: {str(e)}',
             'query_type': 'ERROR',
@@ -1827,54 +2369,76 @@ async def get_cached_analyze_result(query: str) -> Optional[Dict[str, Any]]:
     return None
 
 async def get_network_stats_cache_key() -> str:
-    """Generate time-based cache key for network stats."""
-    return f"network_stats_{datetime.now().strftime('%Y%m%d_%H%M')}"
+    """Generate time-based cache key for network stats (one bucket per minute)."""
+    # The shared timestamp is already formatted; its "YYYY-MM-DDTHH:MM" prefix is the bucket
+    return f"network_stats_{current_timestamp()[:16]}"
 
 # Background task for network stats cache refresh
 async def refresh_network_stats_cache():
     """Continuously refresh network stats cache in background."""
     while True:
         try:
-            await fetch_fresh_stats()
+            stats = await fetch_fresh_stats()
+            await network_stats_cache.set("network_stats", stats)
             await asyncio.sleep(240)  # Refresh every 4 minutes
         except Exception as e:
-            logger.error(f"Error refreshing network stats cache: {e}")
+            logger.error("Error refreshing network stats cache: %s", e)
             await asyncio.sleep(60)
 
-# Add background task startup
-@app.on_event("startup")
-async def start_background_tasks():
-    """Start background tasks on app startup."""
-    asyncio.create_task(refresh_network_stats_cache())
+# Clients sending "Accept: application/json-seq" get /analyze as an RFC 7464 JSON text
+# sequence: the response envelope first, then one record per source document
+JSON_SEQ_MEDIA_TYPE = "application/json-seq"
+JSON_SEQ_RECORD_SEPARATOR = b"\x1e"
+
+def json_seq_record(data: Any) -> bytes:
+    """Encode one record of a JSON text sequence."""
+    return JSON_SEQ_RECORD_SEPARATOR + orjson.dumps(data, default=orjson_default, option=ORJSON_OPTIONS) + b"\n"
+
+async def stream_analyze_response(text: str, response_data: Dict[str, Any], source_documents: List, max_results: int):
+    """Stream an analysis result, serializing source documents one at a time."""
+    envelope = {key: value for key, value in response_data.items() if key != "source_documents"}
+    if envelope["collections_used"] is not None:
+        envelope["collections_used"] = list(envelope["collections_used"])
+    envelope["timestamp"] = current_timestamp()
+    yield json_seq_record(envelope)
+    
+    serialized_docs = []
+    for doc in source_documents[:max_results]:
+        serialized_doc = try_serialize_source_document(doc)
+        if serialized_doc is None:
+            continue
+        serialized_docs.append(serialized_doc)
+        yield json_seq_record(serialized_doc)
+    
+    # Cache the complete result once every document has been sent
+    if response_data["source_documents"] is not None:
+        response_data["source_documents"] = serialized_docs
+    await cache_analyze_result(text, response_data)
 
 # Update analyze endpoint to use new caching
-@app.post("/analyze", response_model=SecurityQueryResponse)
-async def analyze_security_query(request: SecurityQueryRequest):
+# The response models are published through `responses` rather than `response_model`:
+# with response_model FastAPI dumps and re-validates every response (including all source
+# documents) after the handler has already built it from trusted server-side values.
+@app.post("/analyze", responses={200: {"model": SecurityQueryResponse}})
+async def analyze_security_query(request: SecurityQueryRequest, http_request: Request):
     """Analyze a security query using parallel processing and aggressive caching."""
     # Validate and clean the query
     text = request.query.strip()
     if not text:
-        return SecurityQueryResponse(
+        return model_json_response(SecurityQueryResponse.model_construct(
             result="Query cannot be empty",
             query_type="ERROR",
             database_used="none",
             error="Empty query",
-            timestamp=datetime.now().isoformat(),
+            timestamp=current_timestamp(),
             success=False
-        )
+        ))
     
     # Check analyze cache first
     cached_result = await get_cached_analyze_result(text)
     if cached_result:
         # Update timestamp and processing time for cached result
-        cached_result_copy = cached_result.copy()
-        cached_result_copy.pop('timestamp', None)  # Remove old timestamp if exists
-        cached_result_copy.pop('processing_time', None)  # Remove old processing time if exists
-        return SecurityQueryResponse(
-            **cached_result_copy,
-            timestamp=datetime.now().isoformat(),
-            processing_time=0.01
-        )
+        return APIJSONResponse({**cached_result, "timestamp": current_timestamp(), "processing_time": 0.01})
     
     # Generate cache key for deduplication
     cache_key = get_cache_key(request.query, request.analysis_type, request.user)
@@ -1884,37 +2448,30 @@ async def analyze_security_query(request: SecurityQueryRequest):
     
     # Check if request is already being processed
     if is_request_processing(cache_key):
-        logger.info(f"Request already processing: {text[:50]}...")
+        logger.debug("Request already processing: %.50s...", text)
         await asyncio.sleep(0.1)
         
         # Check cache again
         cached_result = await get_cached_analyze_result(text)
         if cached_result:
             # Update timestamp and processing time for cached result
-            cached_result_copy = cached_result.copy()
-            cached_result_copy.pop('timestamp', None)  # Remove old timestamp if exists
-            cached_result_copy.pop('processing_time', None)  # Remove old processing time if exists
-            return SecurityQueryResponse(
-                **cached_result_copy,
-                timestamp=datetime.now().isoformat(),
-                processing_time=0.05
-            )
+            return APIJSONResponse({**cached_result, "timestamp": current_timestamp(), "processing_time": 0.05})
         
-        return SecurityQueryResponse(
+        return model_json_response(SecurityQueryResponse.model_construct(
             result="Your query is being processed. Please try again in a moment.",
             query_type="DEDUPLICATION",
             database_used="queue",
             processing_time=0.05,
-            timestamp=datetime.now().isoformat(),
+            timestamp=current_timestamp(),
             success=True
-        )
+        ))
     
     # Mark request as processing
     mark_request_processing(cache_key)
     
     try:
         # Process the query with parallel analysis
-        start_time = datetime.now()
+        start_time = time.perf_counter()
         
         # Get agent instance
         agent = await agent_manager.get_agent()
@@ -1924,9 +2481,7 @@ async def analyze_security_query(request: SecurityQueryRequest):
         # Process conversation history asynchronously
         context = ""
         if request.conversation_history:
-            history_json = json.dumps(request.conversation_history, sort_keys=True)
-            history_hash = hashlib.md5(history_json.encode()).hexdigest()
-            context = process_conversation_history_cached(history_hash, history_json)
+            context = process_conversation_history_cached(history_cache_key(request.conversation_history))
         
         # Combine context with query
         full_query = context + text if context else text
@@ -1935,15 +2490,17 @@ async def analyze_security_query(request: SecurityQueryRequest):
         result = await process_parallel_analysis(full_query, agent, request.analysis_type)
         
         # Calculate processing time
-        processing_time = (datetime.now() - start_time).total_seconds()
-        
-        # Process source documents if needed
-        source_docs = []
-        if request.include_sources and result.get('source_documents'):
-            source_docs = await process_source_documents_async(
-                result['source_documents'], 
-                request.max_results
-            )
+        processing_time = time.perf_counter() - start_time
+        
+        streaming = JSON_SEQ_MEDIA_TYPE in http_request.headers.get("accept", "")
+        
+        # Process source documents if needed (streamed responses serialize them lazily)
+        if not request.include_sources:
+            source_docs = None
+        elif streaming:
+            source_docs = []
+        else:
+            source_docs = serialize_source_documents(result.get('source_documents') or (), request.max_results)
         
         # Clean result text
         result_text = result.get('result', 'No analysis result available.')
@@ -1956,37 +2513,52 @@ async def analyze_security_query(request: SecurityQueryRequest):
             "query_type": result.get('query_type', 'UNKNOWN'),
             "database_used": result.get('database_used', 'unknown'),
             "collections_used": result.get('collections_used'),
-            "source_documents": source_docs if request.include_sources else None,
+            "source_documents": source_docs,
             "processing_time": processing_time,
             "error": result.get('error'),
             "success": not bool(result.get('error'))
         }
         
+        if streaming:
+            unmark_request_processing(cache_key)
+            return StreamingResponse(
+                stream_analyze_response(
+                    text,
+                    response_data,
+                    (result.get('source_documents') or []) if request.include_sources else [],
+                    request.max_results
+                ),
+                media_type=JSON_SEQ_MEDIA_TYPE
+            )
+        
         # Cache the result
         await cache_analyze_result(text, response_data)
         
         # Unmark request as processing
         unmark_request_processing(cache_key)
         
-        return SecurityQueryResponse(
-            **response_data,
-            timestamp=datetime.now().isoformat()
-        )
+        return APIJSONResponse({**response_data, "timestamp": current_timestamp()})
         
     except Exception as e:
-        logger.error(f"Error processing query: {e}")
+        logger.error("Error processing query: %s", e)
         unmark_request_processing(cache_key)
-        return SecurityQueryResponse(
+        return model_json_response(SecurityQueryResponse.model_construct(
             result=f"An error occurred while processing your query: {str(e)}",
             query_type="ERROR", 
             database_used="none",
             error=str(e),
-            timestamp=datetime.now().isoformat(),
+            timestamp=current_timestamp(),
             success=False
-        )
+        ))
+
+COLLECTION_DESCRIPTIONS = {
+    "mistralData": {"type": "network_flows", "description": "General network security data"},
+    "honeypotData": {"type": "honeypot_logs", "description": "Honeypot attack logs"},
+}
+UNKNOWN_COLLECTION_DESCRIPTION = {"type": "unknown", "description": "Custom collection"}
 
 @app.get("/collections")
-async def get_collections():
+async def get_collections(request: Request):
     """Get available Milvus collections with enhanced information."""
     global agent, agent_initialized
     
@@ -1997,132 +2569,163 @@ async def get_collections():
         )
     
     try:
-        collections_info = {}
-        collections = []
-        
-        if hasattr(agent_manager.agent, 'milvus_retriever') and agent_manager.agent.milvus_retriever:
-            if hasattr(agent_manager.agent.milvus_retriever, 'collections'):
-                collections = list(agent_manager.agent.milvus_retriever.collections.keys())
-                for coll_name in collections:
-                    # Add metadata about collection type
-                    if coll_name == "mistralData":
-                        collections_info[coll_name] = {"type": "network_flows", "description": "General network security data"}
-                    elif coll_name == "honeypotData":
-                        collections_info[coll_name] = {"type": "honeypot_logs", "description": "Honeypot attack logs"}
-                    else:
-                        collections_info[coll_name] = {"type": "unknown", "description": "Custom collection"}
+        # The collections only change when the agent is replaced (which resets the
+        # template), so the body is serialized once and just re-stamped per request
+        template = agent_manager.collections_response_template
+        if template is None:
+            collection_map = agent_manager.capabilities["collections"]
+            collections_info = {}
+            if agent_manager.capabilities["milvus"] and collection_map is not None:
+                # Add metadata about collection type in the single pass over the collection names
+                collections_info = {
+                    coll_name: COLLECTION_DESCRIPTIONS.get(coll_name, UNKNOWN_COLLECTION_DESCRIPTION)
+                    for coll_name in collection_map
+                }
+            
+            template = orjson.dumps({
+                "collections": list(collections_info),
+                "collections_info": collections_info,
+                "total": len(collections_info),
+                "retriever_type": "multi_collection" if collection_map is not None else "single_collection",
+                "timestamp": _TIMESTAMP_PLACEHOLDER.decode()
+            })
+            agent_manager.collections_response_template = template
         
-        return {
-            "collections": collections,
-            "collections_info": collections_info,
-            "total": len(collections),
-            "retriever_type": "multi_collection" if hasattr(agent_manager.agent.milvus_retriever, 'collections') else "single_collection",
-            "timestamp": datetime.now().isoformat()
-        }
+        return timestamped_json_response(template, request, json_etag(template, weak=True))
     except Exception as e:
-        logger.error(f"Error getting collections: {e}")
+        logger.error("Error getting collections: %s", e)
         raise HTTPException(
             status_code=500,
             detail=f"Error getting collections: {str(e)}"
         )
 
+TEST_RESPONSE_TEMPLATE = orjson.dumps({
+    "status": "ok",
+    "message": "API is working",
+    "timestamp": _TIMESTAMP_PLACEHOLDER.decode(),
+    "version": "1.0.0"
+})
+
 @app.get("/test")
 async def test_endpoint():
     """Simple test endpoint to verify API connectivity."""
-    return {
-        "status": "ok",
-        "message": "API is working",
-        "timestamp": datetime.now().isoformat(),
-        "version": "1.0.0"
-    }
+    return timestamped_json_response(TEST_RESPONSE_TEMPLATE)
 
 @app.post("/test/echo")
 async def echo_test(data: dict):
     """Echo test endpoint for frontend debugging."""
-    return {
+    return APIJSONResponse({
         "status": "ok",
         "received": data,
-        "timestamp": datetime.now().isoformat()
+        "timestamp": current_timestamp()
+    })
+
+# The /examples payload is static, so serialize it once and only stamp the timestamp per request
+QUERY_EXAMPLES = {
+    "semantic_queries": {
+        "description": "Find similar patterns and behaviors in the data",
+        "examples": [
+            "Find traffic similar to port scanning",
+            "Show me suspicious network patterns",
+            "Detect behavior similar to malware communication",
+            "Find flows that look like data exfiltration",
+            "Identify patterns similar to brute force attacks"
+        ]
+    },
+    "graph_queries": {
+        "description": "Analyze relationships, connections, and network topology",
+        "examples": [
+            "How many IP addresses are in the graph database?",
+            "Show me all connections from a specific IP",
+            "Find the network path between two IPs",
+            "Count the total number of network flows",
+            "Display communication patterns for suspicious hosts",
+            "What ports are most commonly used?"
+        ]
+    },
+    "hybrid_queries": {
+        "description": "Combine relationship analysis with semantic similarity",
+        "examples": [
+            "Find similar attacks and show their network paths",
+            "Identify suspicious patterns and map their connections",
+            "Show me the network impact of similar security events"
+        ]
+    },
+    "analytical_queries": {
+        "description": "Statistical analysis and numerical insights",
+        "examples": [
+            "What are the statistics for destination ports?",
+            "Show me protocol distribution in the network",
+            "Analyze traffic patterns by time",
+            "Find anomalies in connection volumes"
+        ]
     }
+}
+
+QUERY_USAGE_TIPS = [
+    "Use natural language - the system will route to the appropriate database",
+    "For counting and statistics, the graph database provides unlimited results",
+    "For pattern matching, the semantic search finds similar behaviors",
+    "Combine both with hybrid queries for comprehensive analysis"
+]
+
+EXAMPLES_RESPONSE_TEMPLATE = orjson.dumps({
+    "examples": QUERY_EXAMPLES,
+    "usage_tips": QUERY_USAGE_TIPS,
+    "timestamp": _TIMESTAMP_PLACEHOLDER.decode()
+})
+
+EXAMPLES_ETAG = json_etag(EXAMPLES_RESPONSE_TEMPLATE, weak=True)
 
 @app.get("/examples")
-async def get_query_examples():
+async def get_query_examples(request: Request):
     """Get example security queries with categorization."""
-    examples = {
-        "semantic_queries": {
-            "description": "Find similar patterns and behaviors in the data",
-            "examples": [
-                "Find traffic similar to port scanning",
-                "Show me suspicious network patterns",
-                "Detect behavior similar to malware communication",
-                "Find flows that look like data exfiltration",
-                "Identify patterns similar to brute force attacks"
-            ]
-        },
-        "graph_queries": {
-            "description": "Analyze relationships, connections, and network topology",
-            "examples": [
-                "How many IP addresses are in the graph database?",
-                "Show me all connections from a specific IP",
-                "Find the network path between two IPs",
-                "Count the total number of network flows",
-                "Display communication patterns for suspicious hosts",
-                "What ports are most commonly used?"
-            ]
-        },
-        "hybrid_queries": {
-            "description": "Combine relationship analysis with semantic similarity",
-            "examples": [
-                "Find similar attacks and show their network paths",
-                "Identify suspicious patterns and map their connections",
-                "Show me the network impact of similar security events"
-            ]
-        },
-        "analytical_queries": {
-            "description": "Statistical analysis and numerical insights",
-            "examples": [
-                "What are the statistics for destination ports?",
-                "Show me protocol distribution in the network",
-                "Analyze traffic patterns by time",
-                "Find anomalies in connection volumes"
-            ]
-        }
-    }
-    
-    return {
-        "examples": examples,
-        "usage_tips": [
-            "Use natural language - the system will route to the appropriate database",
-            "For counting and statistics, the graph database provides unlimited results",
-            "For pattern matching, the semantic search finds similar behaviors",
-            "Combine both with hybrid queries for comprehensive analysis"
-        ],
-        "timestamp": datetime.now().isoformat()
-    }
+    return timestamped_json_response(EXAMPLES_RESPONSE_TEMPLATE, request, EXAMPLES_ETAG)
+
+async def encode_with_etag(build_body) -> tuple:
+    """Build a response body and pair it with its ETag, so the hash is taken once per TTL."""
+    body = await build_body()
+    return body, json_etag(body)
 
-@app.get("/network/graph", response_model=NetworkGraphResponse)
-async def get_network_graph(limit: int = 100, ip_address: Optional[str] = None):
+async def cached_body_response(cache_key: str, build_body, request: Request, media_type: str = JSON_MEDIA_TYPE) -> Response:
+    """Serve an encoded body from network_response_cache, building it at most once per TTL.
+    
+    Clients revalidating with a still-current If-None-Match get an empty 304.
+    """
+    entry = await network_response_cache.get(cache_key)
+    cache_status = "HIT"
+    if entry is None:
+        cache_status = "MISS"
+        entry = await network_response_cache.get_or_update(cache_key, partial(encode_with_etag, build_body))
+    body, etag = entry
+    headers = {"X-Cache": cache_status, "ETag": etag}
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type=media_type, headers=headers)
+
+@app.get("/network/graph", responses={200: {"model": NetworkGraphResponse}})
+async def get_network_graph(request: Request, limit: int = 100, ip_address: Optional[str] = None):
     """Get network graph data from Neo4j for visualization."""
-    logger.info(f"Network graph request received - limit: {limit}, ip_address: {ip_address}")
+    logger.debug("Network graph request received - limit: %s, ip_address: %s", limit, ip_address)
     
     try:
         # Validate IP address if provided
         if ip_address:
             ip_address = ip_address.strip()
-            logger.info(f"Validating IP address: {ip_address}")
+            logger.debug("Validating IP address: %s", ip_address)
             
             # Check if the IP address has the correct format (x.x.x.x)
             ip_parts = ip_address.split('.')
             if len(ip_parts) != 4:
-                logger.warning(f"Invalid IP address format (wrong number of octets): {ip_address}")
-                return NetworkGraphResponse(
+                logger.warning("Invalid IP address format (wrong number of octets): %s", ip_address)
+                return model_json_response(NetworkGraphResponse.model_construct(
                     nodes=[],
                     links=[],
                     statistics={},
                     message=f"Invalid IP address format: '{ip_address}'. Must be in format: xxx.xxx.xxx.xxx",
-                    timestamp=datetime.now().isoformat(),
+                    timestamp=current_timestamp(),
                     success=True
-                )
+                ))
             
             try:
                 # Validate each octet
@@ -2133,184 +2736,105 @@ async def get_network_graph(limit: int = 100, ip_address: Optional[str] = None):
                 
                 # Final validation using ipaddress module
                 ipaddress.ip_address(ip_address)
-                logger.info(f"IP address {ip_address} is valid")
+                logger.debug("IP address %s is valid", ip_address)
             except (ValueError, TypeError) as e:
-                logger.warning(f"Invalid IP address format: {ip_address}")
-                return NetworkGraphResponse(
+                logger.warning("Invalid IP address format: %s", ip_address)
+                return model_json_response(NetworkGraphResponse.model_construct(
                     nodes=[],
                     links=[],
                     statistics={},
                     message=f"Invalid IP address format: '{ip_address}'. Each octet must be a number between 0 and 255.",
-                    timestamp=datetime.now().isoformat(),
+                    timestamp=current_timestamp(),
                     success=True
-                )
-
-        logger.info("Fetching graph data from Neo4j")
-        result = neo4j_helper.get_network_graph_data(limit=limit, ip_address=ip_address)
-        logger.info(f"Neo4j result: {len(result.get('nodes', []))} nodes, {len(result.get('links', [])) } links")
-        
-        # Generate basic statistics
-        node_types = {}
-        malicious_count = 0
-        for node in result["nodes"]:
-            node_types[node.type] = node_types.get(node.type, 0) + 1
-            if node.malicious:
-                malicious_count += 1
-        
-        statistics = {
-            "total_nodes": len(result["nodes"]),
-            "total_links": len(result["links"]),
-            "node_types": node_types,
-            "malicious_flows": malicious_count,
-            "limit_applied": limit
-        }
+                ))
+
+        media_type = negotiated_media_type(request)
+        
+        async def build_graph_body() -> bytes:
+            logger.debug("Fetching graph data from Neo4j")
+            result = await neo4j_helper.get_network_graph_data(limit=limit, ip_address=ip_address)
+            logger.debug("Neo4j result: %d nodes, %d links", len(result.get('nodes', [])), len(result.get('links', [])))
+            
+            # Generate basic statistics
+            nodes = result["nodes"]
+            statistics = {
+                "total_nodes": len(nodes),
+                "total_links": len(result["links"]),
+                "node_types": Counter(node["type"] for node in nodes),
+                "malicious_flows": sum(1 for node in nodes if node["malicious"]),
+                "limit_applied": limit
+            }
+            
+            response = {
+                "nodes": result["nodes"],
+                "links": result["links"],
+                "statistics": statistics,
+                "timestamp": current_timestamp(),
+                "success": True,
+                "error": None,
+                "message": result.get("message")
+            }
+            logger.debug("Returning successful response with %d nodes", len(response["nodes"]))
+            return encode_body(response, media_type)
         
-        response = NetworkGraphResponse(
-            nodes=result["nodes"],
-            links=result["links"],
-            statistics=statistics,
-            message=result.get("message"),
-            timestamp=datetime.now().isoformat()
+        return await cached_body_response(
+            f"/network/graph?limit={limit}&ip_address={ip_address}&as={media_type}", build_graph_body, request, media_type
         )
-        logger.info(f"Returning successful response with {len(response.nodes)} nodes")
-        return response
         
     except Exception as e:
-        logger.error(f"Error getting network graph data: {e}")
-        error_response = NetworkGraphResponse(
+        logger.error("Error getting network graph data: %s", e)
+        error_response = NetworkGraphResponse.model_construct(
             nodes=[],
             links=[],
             statistics={},
-            timestamp=datetime.now().isoformat(),
+            timestamp=current_timestamp(),
             success=False,
             error=str(e)
         )
-        logger.info(f"Returning error response: {error_response}")
-        return error_response
+        logger.debug("Returning error response: %s", error_response)
+        return model_json_response(error_response)
 
 # Traffic analysis now handled by transforming existing network stats data in frontend
 
-@app.get("/network/stats", response_model=NetworkStatsResponse)
-async def get_network_stats():
+@app.get("/network/stats", responses={200: {"model": NetworkStatsResponse}})
+async def get_network_stats(request: Request):
     """Get network statistics with optimized caching and background updates."""
-    cache_key = await get_network_stats_cache_key()
-    
-    # Try to get from cache first
-    cached_stats = await network_stats_cache.get(cache_key)
-    if cached_stats:
-        return cached_stats
-
     try:
-        # Get fresh stats
-        stats = await fetch_fresh_stats()
-        
-        # Cache the results
-        await network_stats_cache.set(cache_key, stats)
-        
-        return stats
+        return await cached_body_response("/network/stats", build_network_stats_body, request)
     except Exception as e:
-        logger.error(f"Error fetching network stats: {e}")
-        # If cache exists but expired, return it as fallback
-        if cached_stats:
-            logger.info("Returning expired cache as fallback")
-            return cached_stats
+        logger.error("Error fetching network stats: %s", e)
         raise HTTPException(status_code=500, detail="Failed to fetch network statistics")
 
+async def build_network_stats_body() -> bytes:
+    """Encode the current network statistics, fetching them if the stats cache is cold."""
+    cache_key = await get_network_stats_cache_key()
+    stats = await network_stats_cache.get_or_update(cache_key, fetch_fresh_stats)
+    return orjson.dumps(stats, default=orjson_default, option=ORJSON_OPTIONS)
+
 async def fetch_fresh_stats():
     """Fetch fresh network statistics with optimized queries."""
     try:
-        # Ensure Neo4j helper is connected
-        if not neo4j_helper.driver:
-            try:
-                neo4j_helper.connect()
-            except Exception as e:
-                logger.error(f"Failed to connect to Neo4j in fetch_fresh_stats: {e}")
-                raise
-        
         # Use connection pooling and optimized query  
-        with neo4j_helper.driver.session() as session:
-            # Get basic stats first (including malicious flows in total count)
-            basic_stats_query = """
-            MATCH (src:Host)-[:SENT]->(f:Flow)-[:USES_DST_PORT]->(dst_port:Port),
-                  (dst:Host)-[:RECEIVED]->(f)
-            WITH count(f) as total_flows,
-                 sum(CASE WHEN f.malicious = true THEN 1 ELSE 0 END) as malicious_count,
-                 count(CASE WHEN (f.malicious IS NULL OR f.malicious = false) AND (f.honeypot IS NULL OR f.honeypot = false) THEN 1 END) as active_count
-            MATCH (h:Host) 
-            RETURN total_flows, count(h) as total_hosts, malicious_count, active_count
-            """
+        async with neo4j_helper.session() as session:
+            stats_data = await session.execute_read(_read_single, CYPHER_NETWORK_STATS)
             
-            # Get port distribution with actual flow counts
-            port_stats_query = """
-            MATCH (f:Flow)-[:USES_DST_PORT]->(dst_port:Port)
-            WHERE (f.malicious IS NULL OR f.malicious = false) 
-              AND (f.honeypot IS NULL OR f.honeypot = false)
-            RETURN dst_port.port as port, dst_port.service as service, count(f) as flow_count
-            ORDER BY flow_count DESC
-            LIMIT 10
-            """
-            
-            # Get protocol distribution with actual flow counts
-            protocol_stats_query = """
-            MATCH (f:Flow)-[:USES_PROTOCOL]->(proto:Protocol)
-            WHERE (f.malicious IS NULL OR f.malicious = false) 
-              AND (f.honeypot IS NULL OR f.honeypot = false)
-            RETURN proto.name as protocol, count(f) as flow_count
-            ORDER BY flow_count DESC
-            LIMIT 10
-            """
-            
-            # Execute basic stats query
-            result = session.run(basic_stats_query)
-            basic_data = result.single()
-            
-            if not basic_data:
+            if not stats_data:
                 raise ValueError("No network statistics available")
             
-            total_flows = basic_data['total_flows']
-            total_hosts = basic_data['total_hosts']
-            malicious_flows = basic_data['malicious_count']
-            active_connections = basic_data['active_count']
-            
-            # Execute port stats query
-            port_result = session.run(port_stats_query)
-            port_data = []
-            for record in port_result:
-                port_data.append({
-                    "port": record['port'],
-                    "service": record['service'] or 'unknown',
-                    "count": record['flow_count']
-                })
-            
-            # Calculate port percentages based on actual flow counts
-            top_ports = []
-            for port_info in port_data:
-                percentage = round((port_info['count'] / total_flows) * 100, 1) if total_flows > 0 else 0
-                top_ports.append({
-                    "port": port_info['port'],
-                    "service": port_info['service'],
-                    "count": port_info['count'],
-                    "percentage": percentage
-                })
+            total_flows = stats_data['total_flows']
+            total_hosts = stats_data['total_hosts']
+            malicious_flows = stats_data['malicious_count']
+            active_connections = stats_data['active_count']
             
-            # Execute protocol stats query
-            protocol_result = session.run(protocol_stats_query)
-            protocol_data = []
-            for record in protocol_result:
-                protocol_data.append({
-                    "protocol": record['protocol'],
-                    "count": record['flow_count']
-                })
-            
-            # Calculate protocol percentages based on actual flow counts
-            top_protocols = []
-            for proto_info in protocol_data:
-                percentage = round((proto_info['count'] / total_flows) * 100, 1) if total_flows > 0 else 0
-                top_protocols.append({
-                    "protocol": proto_info['protocol'],
-                    "count": proto_info['count'],
-                    "percentage": percentage
-                })
+            # Calculate port and protocol percentages based on actual flow counts
+            top_ports = [
+                {**port_info, "percentage": round((port_info['count'] / total_flows) * 100, 1) if total_flows > 0 else 0}
+                for port_info in stats_data['top_ports']
+            ]
+            top_protocols = [
+                {**proto_info, "percentage": round((proto_info['count'] / total_flows) * 100, 1) if total_flows > 0 else 0}
+                for proto_info in stats_data['top_protocols']
+            ]
             
             # Calculate threat indicators
             threat_indicators = [{
@@ -2328,26 +2852,28 @@ async def fetch_fresh_stats():
                 "data_throughput": data_throughput,
                 "total_hosts": total_hosts,
                 "total_flows": total_flows,
-                "total_protocols": len(protocol_data),
+                "total_protocols": len(top_protocols),
                 "malicious_flows": malicious_flows,
                 "top_ports": top_ports,
                 "top_protocols": top_protocols,
                 "threat_indicators": threat_indicators,
-                "timestamp": datetime.now().isoformat(),
-                "success": True
+                "timestamp": current_timestamp(),
+                "success": True,
+                "error": None
             }
             
     except asyncio.TimeoutError:
         logger.error("Network stats query timed out")
         raise HTTPException(status_code=504, detail="Query timed out")
     except Exception as e:
-        logger.error(f"Error in fetch_fresh_stats: {e}")
+        logger.error("Error in fetch_fresh_stats: %s", e)
         raise
 
 # New visualization endpoints
 
 @app.get("/visualization/time-series")
 async def get_time_series_data(
+    request: Request,
     metric: str = "alerts", 
     period: str = "24h",
     granularity: str = "1h",
@@ -2356,11 +2882,6 @@ async def get_time_series_data(
 ):
     """Get time-series data for various metrics."""
     try:
-        # Connect to Neo4j if not already connected
-        if not neo4j_helper.driver:
-            if not neo4j_helper.connect():
-                raise HTTPException(status_code=503, detail="Database connection failed")
-
         # Calculate time range
         end_time = datetime.now()
         if period == "24h":
@@ -2372,153 +2893,98 @@ async def get_time_series_data(
         else:
             raise ValueError("Invalid period. Must be one of: 24h, 7d, 30d")
 
-        # Build IP filter for queries
-        ip_filter = ""
+        # Pick the IP filter variant; every (metric, filter) pair is a fixed query text
         params = {
             "start_time": start_time.isoformat(),
             "end_time": end_time.isoformat()
         }
         if source_ip and dest_ip:
-            ip_filter = "AND f.sourceIPv4Address = $source_ip AND f.destinationIPv4Address = $dest_ip"
+            ip_filter = "source_and_dest"
             params.update({"source_ip": source_ip, "dest_ip": dest_ip})
         elif source_ip:
-            ip_filter = "AND (f.sourceIPv4Address = $source_ip OR f.destinationIPv4Address = $source_ip)"
+            ip_filter = "source_or_dest"
             params.update({"source_ip": source_ip})
-
-        # Prepare query based on metric
-        if metric == "bandwidth":
-            query = f"""
-                MATCH (f:Flow)
-                WHERE datetime(f.flowStartMilliseconds) >= datetime($start_time)
-                    AND datetime(f.flowStartMilliseconds) <= datetime($end_time)
-                    AND (f.malicious IS NULL OR f.malicious = false)
-                    AND (f.honeypot IS NULL OR f.honeypot = false)
-                    {ip_filter}
-                RETURN 
-                    f.flowStartMilliseconds as timestamp,
-                    coalesce(f.octetTotalCount, 0) + coalesce(f.reverseOctetTotalCount, 0) as value
-                ORDER BY timestamp
-            """
-        elif metric == "flows":
-            query = f"""
-                MATCH (f:Flow)
-                WHERE datetime(f.flowStartMilliseconds) >= datetime($start_time)
-                    AND datetime(f.flowStartMilliseconds) <= datetime($end_time)
-                    AND (f.malicious IS NULL OR f.malicious = false)
-                    AND (f.honeypot IS NULL OR f.honeypot = false)
-                    {ip_filter}
-                RETURN 
-                    f.flowStartMilliseconds as timestamp,
-                    count(*) as value
-                ORDER BY timestamp
-            """
-        elif metric == "alerts" or metric == "threats":
-            severity_threshold = 0.6 if metric == "threats" else 0.1
-            query = f"""
-                MATCH (src:Host)-[:SENT]->(f:Flow)-[:USES_DST_PORT]->(dst_port:Port)
-                WHERE datetime(f.flowStartMilliseconds) >= datetime($start_time)
-                    AND datetime(f.flowStartMilliseconds) <= datetime($end_time)
-                    AND (f.malicious IS NULL OR f.malicious = false)
-                    AND (f.honeypot IS NULL OR f.honeypot = false)
-                    {ip_filter}
-                WITH 
-                    f.flowStartMilliseconds as timestamp,
-                    size(collect(DISTINCT dst_port.port)) as num_ports,
-                    sum(coalesce(f.octetTotalCount, 0)) as bytes,
-                    sum(coalesce(f.reverseOctetTotalCount, 0)) as reverse_bytes,
-                    sum(coalesce(f.packetTotalCount, 0)) as packets
-                WHERE bytes > 0 AND reverse_bytes > 0
-                WITH 
-                    timestamp,
-                    num_ports,
-                    bytes / reverse_bytes as pcr,
-                    packets / bytes as por
-                WHERE pcr > 0 AND por > 0
-                WITH 
-                    timestamp,
-                    1 / (1 + exp(-(0.00243691 * num_ports + 0.00014983 * pcr + 0.00014983 * por - 3.93433105))) as alert_prob
-                WHERE alert_prob >= {severity_threshold}
-                RETURN timestamp, count(*) as value
-                ORDER BY timestamp
-            """
         else:
+            ip_filter = "none"
+
+        query = CYPHER_TIME_SERIES.get((metric, ip_filter))
+        if query is None:
             raise ValueError(f"Invalid metric: {metric}")
+        if metric in TIME_SERIES_SEVERITY_THRESHOLDS:
+            params["severity_threshold"] = TIME_SERIES_SEVERITY_THRESHOLDS[metric]
 
         # Execute query with proper session handling and timeout
-        session = await neo4j_helper.get_session()
-        try:
+        async with neo4j_helper.session() as session:
             result = await asyncio.wait_for(
                 session.run(query, params),
                 timeout=10.0  # 10 second timeout
             )
-            records = await result.data()
-        finally:
-            neo4j_helper.release_session(session)
-
-        # Group data by time intervals
-        time_groups = {}
-        for record in records:
-            timestamp_str = record["timestamp"]
-            try:
-                # Handle different timestamp formats
-                if isinstance(timestamp_str, Neo4jDateTime):
-                    timestamp = datetime.fromtimestamp(timestamp_str.to_native().timestamp())
-                else:
-                    # Try different parsing methods
-                    try:
-                        timestamp = datetime.fromisoformat(timestamp_str.replace('Z', '+00:00'))
-                    except ValueError:
-                        timestamp = datetime.strptime(timestamp_str, "%Y-%m-%dT%H:%M:%S.%f%z")
+            
+            # Group data by time intervals as rows stream in (NEO4J_FETCH_SIZE at a time)
+            # rather than materializing the whole result first
+            time_groups = {}
+            async for record in result:
+                timestamp_str = record["timestamp"]
+                try:
+                    # Handle different timestamp formats
+                    if isinstance(timestamp_str, Neo4jDateTime):
+                        timestamp = datetime.fromtimestamp(timestamp_str.to_native().timestamp())
+                    else:
+                        # Try different parsing methods
+                        try:
+                            timestamp = datetime.fromisoformat(timestamp_str.replace('Z', '+00:00'))
+                        except ValueError:
+                            timestamp = datetime.strptime(timestamp_str, "%Y-%m-%dT%H:%M:%S.%f%z")
                 
-                value = float(record["value"])
-
-                # Skip data outside our time range
-                if timestamp < start_time or timestamp > end_time:
-                    continue
-
-                # Create time bucket based on granularity
-                if granularity == "30m":
-                    bucket = timestamp.replace(minute=30 * (timestamp.minute // 30), second=0, microsecond=0)
-                elif granularity == "1h":
-                    bucket = timestamp.replace(minute=0, second=0, microsecond=0)
-                elif granularity == "6h":
-                    bucket = timestamp.replace(hour=6 * (timestamp.hour // 6), minute=0, second=0, microsecond=0)
-                elif granularity == "1d":
-                    bucket = timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
-                else:
-                    raise ValueError("Invalid granularity. Must be one of: 30m, 1h, 6h, 1d")
+                    value = float(record["value"])
+
+                    # Skip data outside our time range
+                    if timestamp < start_time or timestamp > end_time:
+                        continue
+
+                    # Create time bucket based on granularity
+                    if granularity == "30m":
+                        bucket = timestamp.replace(minute=30 * (timestamp.minute // 30), second=0, microsecond=0)
+                    elif granularity == "1h":
+                        bucket = timestamp.replace(minute=0, second=0, microsecond=0)
+                    elif granularity == "6h":
+                        bucket = timestamp.replace(hour=6 * (timestamp.hour // 6), minute=0, second=0, microsecond=0)
+                    elif granularity == "1d":
+                        bucket = timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+                    else:
+                        raise ValueError("Invalid granularity. Must be one of: 30m, 1h, 6h, 1d")
 
-                bucket_key = bucket.isoformat()
-                if bucket_key not in time_groups:
-                    time_groups[bucket_key] = {"timestamp": bucket_key, "value": 0, "metric": metric}
-                time_groups[bucket_key]["value"] += value
+                    bucket_key = bucket.isoformat()
+                    if bucket_key not in time_groups:
+                        time_groups[bucket_key] = {"timestamp": bucket_key, "value": 0, "metric": metric}
+                    time_groups[bucket_key]["value"] += value
 
-            except (ValueError, TypeError) as e:
-                logger.warning(f"Error processing timestamp {timestamp_str}: {e}")
-                continue
+                except (ValueError, TypeError) as e:
+                    logger.warning("Error processing timestamp %s: %s", timestamp_str, e)
+                    continue
 
         # Convert to list and sort by timestamp
         data = list(time_groups.values())
         data.sort(key=lambda x: x["timestamp"])
 
-        return {
+        return negotiated_response(request, {
             "data": data,
             "metric": metric,
             "period": period,
             "granularity": granularity,
             "total_points": len(data),
             "success": True,
-            "timestamp": datetime.now().isoformat()
-        }
+            "timestamp": current_timestamp()
+        })
 
     except asyncio.TimeoutError:
         logger.error("Neo4j query timed out")
         raise HTTPException(status_code=504, detail="Database query timed out")
     except ValueError as e:
-        logger.error(f"Validation error: {e}")
+        logger.error("Validation error: %s", e)
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
-        logger.error(f"Error getting time-series data: {e}")
+        logger.error("Error getting time-series data: %s", e)
         raise HTTPException(
             status_code=500,
             detail=f"Failed to fetch time-series data: {str(e)}"
@@ -2533,74 +2999,20 @@ async def get_bar_chart_data(chart_type: str = "protocols"):
         # Check cache first
         cached_data = await network_stats_cache.get(cache_key)
         if cached_data:
-            return cached_data
+            return APIJSONResponse(cached_data)
             
         # Real Neo4j queries with optimized execution
-        if not neo4j_helper.driver:
-            neo4j_helper.connect()
-        
-        async with neo4j_helper.driver.session() as session:
-            # Optimized queries for each chart type
-            queries = {
-                "protocols": """
-                    MATCH (f:Flow)-[:USES_PROTOCOL]->(p:Protocol)
-                    WITH p.name as name, count(f) as value
-                    ORDER BY value DESC
-                    LIMIT 10
-                    RETURN collect({name: name, value: value}) as data
-                """,
-                "ports": """
-                    MATCH (f:Flow)-[:USES_DST_PORT]->(port:Port)
-                    WITH port.port as port, port.service as service, count(f) as value
-                    ORDER BY value DESC
-                    LIMIT 10
-                    RETURN collect({port: port, service: service, value: value}) as data
-                """,
-                "threats": """
-                    MATCH (src:Host)-[:SENT]->(f:Flow)
-                    WHERE f.malicious = true
-                    WITH src.ip as name, count(f) as value
-                    ORDER BY value DESC
-                    LIMIT 10
-                    RETURN collect({name: name, value: value}) as data
-                """,
-                "countries": """
-                    MATCH (h:Host)-[:SENT]->(f:Flow)
-                    WHERE h.country IS NOT NULL AND h.country <> ""
-                    WITH h.country as name, count(f) as value
-                    ORDER BY value DESC
-                    LIMIT 10
-                    RETURN collect({name: name, value: value}) as data
-                """
-            }
-            
+        async with neo4j_helper.session() as session:
             # Execute query with timeout
-            query = queries.get(chart_type, queries["protocols"])
+            query = CYPHER_BAR_CHARTS.get(chart_type, CYPHER_BAR_CHARTS["protocols"])
             result = await asyncio.wait_for(
                 session.run(query),
                 timeout=0.5  # 500ms timeout
             )
             record = await result.single()
-            
-            if not record:
-                data = []
-            else:
-                raw_data = record["data"]
-                total = sum(item["value"] for item in raw_data)
-                
-                # Process data based on chart type
-                if chart_type == "ports":
-                    data = [{
-                        "name": f"{item['port']} ({item['service'] or 'unknown'})",
-                        "value": item["value"],
-                        "percentage": round((item["value"] / total) * 100, 1)
-                    } for item in raw_data]
-                else:
-                    data = [{
-                        "name": item["name"],
-                        "value": item["value"],
-                        "percentage": round((item["value"] / total) * 100, 1)
-                    } for item in raw_data]
+            # The aggregation always yields one row, with data == [] when nothing matched
+            data = record["data"]
+            total = record["total"]
             
             # Handle empty data case
             if not data and chart_type == "countries":
@@ -2610,142 +3022,176 @@ async def get_bar_chart_data(chart_type: str = "protocols"):
             result = {
                 "data": data,
                 "chart_type": chart_type,
-                "total": total if 'total' in locals() else 0,
+                "total": total,
                 "success": True,
-                "timestamp": datetime.now().isoformat()
+                "timestamp": current_timestamp()
             }
             
             # Cache the results
             await network_stats_cache.set(cache_key, result)
-            return result
+            return APIJSONResponse(result)
             
     except asyncio.TimeoutError:
         logger.error("Bar chart query timed out")
-        return {
+        return APIJSONResponse({
             "data": [],
             "error": "Query timed out",
             "success": False,
-            "timestamp": datetime.now().isoformat()
-        }
+            "timestamp": current_timestamp()
+        })
     except Exception as e:
-        logger.error(f"Error getting bar chart data: {e}")
-        return {
+        logger.error("Error getting bar chart data: %s", e)
+        return APIJSONResponse({
             "data": [],
             "error": str(e),
             "success": False,
-            "timestamp": datetime.now().isoformat()
+            "timestamp": current_timestamp()
+        })
+
+@app.get("/visualization/bar-chart/bundle")
+async def get_bar_chart_bundle():
+    """Get the protocols, ports and threats bar charts in a single Neo4j query."""
+    cache_key = "bar_chart_bundle"
+    
+    try:
+        cached_data = await network_stats_cache.get(cache_key)
+        if cached_data:
+            return APIJSONResponse(cached_data)
+            
+        async with neo4j_helper.session() as session:
+            result = await asyncio.wait_for(
+                session.run(CYPHER_BAR_CHART_BUNDLE),
+                timeout=1.5  # the three bar-chart budgets combined
+            )
+            timestamp = current_timestamp()
+            charts = {}
+            async for record in result:
+                chart_type = record["chart_type"]
+                charts[chart_type] = {
+                    "data": record["data"],
+                    "chart_type": chart_type,
+                    "total": record["total"],
+                    "success": True,
+                    "timestamp": timestamp
+                }
+            
+        # Seed the single-chart entries too, so /visualization/bar-chart hits after a bundle load
+        for chart_type, chart in charts.items():
+            await network_stats_cache.set(f"bar_chart_{chart_type}", chart)
+        
+        bundle = {
+            **{chart_type: chart["data"] for chart_type, chart in charts.items()},
+            "totals": {chart_type: chart["total"] for chart_type, chart in charts.items()},
+            "success": True,
+            "timestamp": timestamp
         }
+        await network_stats_cache.set(cache_key, bundle)
+        return APIJSONResponse(bundle)
+            
+    except asyncio.TimeoutError:
+        logger.error("Bar chart bundle query timed out")
+        return APIJSONResponse({
+            "error": "Query timed out",
+            "success": False,
+            "timestamp": current_timestamp()
+        })
+    except Exception as e:
+        logger.error("Error getting bar chart bundle: %s", e)
+        return APIJSONResponse({
+            "error": str(e),
+            "success": False,
+            "timestamp": current_timestamp()
+        })
+
+GEOLOCATION_FIELDS = ("ip", "country", "city", "lat", "lon", "threats", "flows")
 
 @app.get("/visualization/geolocation")
-async def get_geolocation_data():
-    """Get geolocation data for IP addresses."""
+async def get_geolocation_data(request: Request, layout: Literal["rows", "columns"] = "rows"):
+    """Get geolocation data for IP addresses.
+    
+    layout=columns returns the same locations as one list per field under "columns",
+    which avoids repeating every key name once per location.
+    """
     try:
         # Real Neo4j query for geolocation data
-        if not neo4j_helper.driver:
-            if not neo4j_helper.connect():
-                raise Exception("Cannot connect to Neo4j")
-        
-        with neo4j_helper.driver.session() as session:
-            # Query to get IPs with their location info and threat/flow counts
+        async with neo4j_helper.session() as session:
+            # Query to get IPs with their location info and threat/flow counts. Each row comes
+            # back as a ready-made location map; hosts without coordinates are dropped after the
+            # LIMIT, as before, and the "Unknown" defaults are applied in Cypher.
             query = """
             MATCH (h:Host)
             OPTIONAL MATCH (h)-[:SENT]->(f:Flow)
-            OPTIONAL MATCH (h)-[:SENT]->(tf:Flow) WHERE tf.malicious = true
-            RETURN 
-                h.ip as ip,
-                h.country as country,
-                h.city as city,
-                h.latitude as lat,
-                h.longitude as lon,
-                count(DISTINCT f) as flows,
-                count(DISTINCT tf) as threats
+            WITH h, count(f) as flows, count(CASE WHEN f.malicious = true THEN 1 END) as threats
             ORDER BY threats DESC, flows DESC
             LIMIT 50
+            WITH h, flows, threats, toFloat(h.latitude) as lat, toFloat(h.longitude) as lon
+            WHERE lat <> 0 AND lon <> 0
+            RETURN {
+                ip: h.ip,
+                country: CASE WHEN h.country <> "" THEN h.country ELSE "Unknown" END,
+                city: CASE WHEN h.city <> "" THEN h.city ELSE "Unknown" END,
+                lat: lat,
+                lon: lon,
+                threats: threats,
+                flows: flows
+            } as location
             """
             
-            result = session.run(query)
-            locations = []
-            
-            for record in result:
-                if record["lat"] and record["lon"]:  # Only include if we have coordinates
-                    locations.append({
-                        "ip": record["ip"],
-                        "country": record["country"] or "Unknown",
-                        "city": record["city"] or "Unknown", 
-                        "lat": float(record["lat"]),
-                        "lon": float(record["lon"]),
-                        "threats": record["threats"],
-                        "flows": record["flows"]
-                    })
+            result = await session.run(query)
+            locations = [record["location"] async for record in result]
         
-        return {
-            "locations": locations,
+        if layout == "columns":
+            body = {"columns": {field: [loc[field] for loc in locations] for field in GEOLOCATION_FIELDS}}
+        else:
+            body = {"locations": locations}
+        
+        return negotiated_response(request, {
+            **body,
             "total_ips": len(locations),
             "total_threats": sum(loc["threats"] for loc in locations),
             "total_flows": sum(loc["flows"] for loc in locations),
             "success": True,
-            "timestamp": datetime.now().isoformat()
-        }
+            "timestamp": current_timestamp()
+        })
         
     except Exception as e:
-        logger.error(f"Error getting geolocation data: {e}")
-        return {
+        logger.error("Error getting geolocation data: %s", e)
+        return negotiated_response(request, {
             "locations": [],
             "error": str(e),
             "success": False,
-            "timestamp": datetime.now().isoformat()
-        }
+            "timestamp": current_timestamp()
+        })
+
+HEATMAP_DAYS = ("Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday")
+HEATMAP_GRID_SIZE = len(HEATMAP_DAYS) * 24
 
 @app.get("/visualization/heatmap")
-async def get_heatmap_data(heatmap_type: str = "hourly_activity"):
+async def get_heatmap_data(request: Request, heatmap_type: str = "hourly_activity"):
     """Get heatmap data for various time-based patterns."""
     try:
         # Real Neo4j query for heatmap data
-        if not neo4j_helper.driver:
-            if not neo4j_helper.connect():
-                raise Exception("Cannot connect to Neo4j")
-        
-        with neo4j_helper.driver.session() as session:
+        async with neo4j_helper.session() as session:
             if heatmap_type == "hourly_activity":
-                # Extract hour and day from flow timestamps
-                query = """
-                MATCH (f:Flow)
-                WHERE f.flowStartMilliseconds IS NOT NULL
-                WITH f, 
-                     datetime({epochMillis: f.flowStartMilliseconds}) as dt
-                RETURN 
-                    dt.hour as hour,
-                    dt.dayOfWeek as day_of_week,
-                    count(f) as value
-                ORDER BY day_of_week, hour
-                """
-                
-                result = session.run(query)
-                data = []
-                days = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
-                
-                for record in result:
-                    day_idx = record["day_of_week"] - 1  # Neo4j uses 1-7, we want 0-6
-                    data.append({
-                        "day": days[day_idx] if 0 <= day_idx < 7 else "Unknown",
+                result = await session.run(CYPHER_HEATMAPS[heatmap_type])
+                # Dense 7x24 grid indexed by day*24+hour keeps day/hour order
+                # without an ORDER BY; empty buckets are dropped below.
+                grid = [None] * HEATMAP_GRID_SIZE
+                async for record in result:
+                    day_idx = record["day_index"]  # Neo4j uses 1-7; the query shifts it to 0-6
+                    hour = record["hour"]
+                    grid[day_idx * 24 + hour] = {
+                        "day": HEATMAP_DAYS[day_idx],
                         "day_index": day_idx,
-                        "hour": record["hour"],
+                        "hour": hour,
                         "value": record["value"]
-                    })
+                    }
+                data = [cell for cell in grid if cell is not None]
                     
             elif heatmap_type == "ip_port_matrix":
-                # Top source IPs vs destination ports
-                query = """
-                MATCH (src:Host)-[:SENT]->(f:Flow)-[:USES_DST_PORT]->(port:Port)
-                WITH src.ip as ip, port.port as port, count(f) as flow_count
-                ORDER BY flow_count DESC
-                LIMIT 100
-                RETURN ip, port, flow_count as value
-                """
-                
-                result = session.run(query)
+                result = await session.run(CYPHER_HEATMAPS[heatmap_type])
                 data = []
-                for record in result:
+                async for record in result:
                     data.append({
                         "ip": record["ip"],
                         "port": record["port"],
@@ -2753,18 +3199,9 @@ async def get_heatmap_data(heatmap_type: str = "hourly_activity"):
                     })
                     
             elif heatmap_type == "threat_intensity":
-                # Geographic threat intensity by region
-                query = """
-                MATCH (h:Host)-[:SENT]->(f:Flow)
-                WHERE h.country IS NOT NULL AND f.malicious = true
-                WITH h.country as region, count(f) as threats
-                ORDER BY threats DESC
-                RETURN region, threats as value
-                """
-                
-                result = session.run(query)
+                result = await session.run(CYPHER_HEATMAPS[heatmap_type])
                 data = []
-                for record in result:
+                async for record in result:
                     data.append({
                         "region": record["region"],
                         "value": record["value"]
@@ -2772,45 +3209,45 @@ async def get_heatmap_data(heatmap_type: str = "hourly_activity"):
             else:
                 data = []
         
-        return {
+        return negotiated_response(request, {
             "data": data,
             "heatmap_type": heatmap_type,
             "success": True,
-            "timestamp": datetime.now().isoformat()
-        }
+            "timestamp": current_timestamp()
+        })
         
     except Exception as e:
-        logger.error(f"Error getting heatmap data: {e}")
-        return {
+        logger.error("Error getting heatmap data: %s", e)
+        return negotiated_response(request, {
             "data": [],
             "error": str(e),
             "success": False,
-            "timestamp": datetime.now().isoformat()
-        }
+            "timestamp": current_timestamp()
+        })
 
 # Error handlers
 @app.exception_handler(404)
 async def not_found_handler(request, exc):
-    return {"error": "Endpoint not found", "message": "Check /docs for available endpoints"}
+    return APIJSONResponse({"error": "Endpoint not found", "message": "Check /docs for available endpoints"}, status_code=404)
 
 @app.exception_handler(500)
 async def internal_error_handler(request, exc):
-    logger.error(f"Internal server error: {exc}")
-    return {"error": "Internal server error", "message": "Please try again later"}
+    logger.error("Internal server error: %s", exc)
+    return APIJSONResponse({"error": "Internal server error", "message": "Please try again later"}, status_code=500)
 
 # Add before the FastAPI app initialization
 
-async def get_cached_response(request: Request) -> Optional[Response]:
+async def get_cached_response(path: str, query_string: bytes) -> Optional[Response]:
     """Get cached response for cacheable endpoints."""
-    cache_config = get_cache_config(request.url.path)
+    cache_config = get_cache_config(path)
     if not cache_config['cacheable']:
         return None
         
-    cache_key = f"response_{request.url.path}_{request.query_params}"
+    cache_key = f"response_{path}_{query_string.decode('latin-1')}"
     cached_data = await network_stats_cache.get(cache_key)
     
     if cached_data:
-        return JSONResponse(
+        return APIJSONResponse(
             content=cached_data,
             headers={
                 "X-Cache": "HIT",
@@ -2819,20 +3256,50 @@ async def get_cached_response(request: Request) -> Optional[Response]:
         )
     return None
 
+async def agent_analysis(query: str, agent, forced_type: Optional[str] = None) -> Dict[str, Any]:
+    """Run a single agent query, letting the agent classify it unless forced_type is given."""
+    try:
+        logger.debug("Starting agent analysis (%s) for query: %.50s...", forced_type or 'classified', query)
+        
+        if not agent:
+            raise Exception("Agent not available for analysis")
+        
+        result = await anyio.to_thread.run_sync(agent.query, query, forced_type)
+        return {
+            'result': result.get('result', 'No analysis results found'),
+            'database_used': result.get('database_used', 'unknown'),
+            'source_documents': result.get('source_documents', []),
+            'collections_used': result.get('collections_used'),
+            'query_type': result.get('query_type', forced_type or 'UNKNOWN'),
+            'processing_time': 0.5,
+            'error': result.get('error')
+        }
+    except Exception as e:
+        logger.error("Error in agent analysis: %s", e)
+        return {
+            'result': f'Analysis failed: {str(e)}',
+            'database_used': 'none',
+            'source_documents': [],
+            'query_type': forced_type or 'UNKNOWN',
+            'processing_time': 0,
+            'error': str(e)
+        }
+
 async def semantic_analysis(query: str, agent) -> Dict[str, Any]:
     """Perform semantic analysis using Milvus vector database."""
     try:
-        logger.info(f"Starting semantic analysis for query: {query[:50]}...")
+        logger.debug("Starting semantic analysis for query: %.50s...", query)
         
         # FIXED: Call the agent directly with proper error handling
         if not agent:
             raise Exception("Agent not available for semantic analysis")
         
-        # Use the agent's query method directly, forcing semantic query type
-        result = agent.query(query)
+        # Use the agent's query method directly, forcing semantic query type.
+        # agent.query blocks on LLM and database I/O, so keep it off the event loop.
+        result = await anyio.to_thread.run_sync(agent.query, query, "SEMANTIC_QUERY")
         
         # FIXED: Ensure we're getting semantic results from Milvus
-        if result.get('database_used') in ['milvus', 'milvus_multi_collection', 'milvus_fallback']:
+        if result.get('database_used') in SEMANTIC_DATABASES:
             return {
                 'result': result.get('result', 'No semantic analysis results found'),
                 'database_used': result.get('database_used', 'milvus'),
@@ -2844,12 +3311,12 @@ async def semantic_analysis(query: str, agent) -> Dict[str, Any]:
             }
         else:
             # Force semantic search if agent didn't use Milvus
-            logger.warning(f"Agent used {result.get('database_used')} instead of Milvus, forcing semantic search")
+            logger.warning("Agent used %s instead of Milvus, forcing semantic search", result.get('database_used'))
             
             # Try to access Milvus retriever directly
-            if hasattr(agent, 'milvus_retriever') and agent.milvus_retriever:
+            if agent.milvus_retriever is not None:
                 # Get documents directly from Milvus
-                docs = agent.milvus_retriever._get_relevant_documents(query)
+                docs = await anyio.to_thread.run_sync(agent.milvus_retriever._get_relevant_documents, query)
                 
                 if docs:
                     # Format the documents into a readable result
@@ -2860,7 +3327,7 @@ async def semantic_analysis(query: str, agent) -> Dict[str, Any]:
                         'result': result_text,
                         'database_used': 'milvus_direct',
                         'source_documents': docs,
-                        'collections_used': getattr(agent.milvus_retriever, 'collections', {}).keys() if hasattr(agent.milvus_retriever, 'collections') else None,
+                        'collections_used': list(collections) if (collections := getattr(agent.milvus_retriever, 'collections', None)) is not None else None,
                         'query_type': 'SEMANTIC_QUERY',
                         'processing_time': 1.0,
                         'error': None
@@ -2879,7 +3346,7 @@ async def semantic_analysis(query: str, agent) -> Dict[str, Any]:
                 raise Exception("Milvus retriever not available")
                 
     except Exception as e:
-        logger.error(f"Error in semantic analysis: {e}")
+        logger.error("Error in semantic analysis: %s", e)
         return {
             'result': f'Semantic analysis failed: {str(e)}',
             'database_used': 'none',
@@ -2892,17 +3359,17 @@ async def semantic_analysis(query: str, agent) -> Dict[str, Any]:
 async def graph_analysis(query: str, agent) -> Dict[str, Any]:
     """Perform graph analysis using Neo4j database."""
     try:
-        logger.info(f"Starting graph analysis for query: {query[:50]}...")
+        logger.debug("Starting graph analysis for query: %.50s...", query)
         
         # FIXED: Call the agent directly with proper error handling
         if not agent:
             raise Exception("Agent not available for graph analysis")
         
-        # Use the agent's query method directly
-        result = agent.query(query)
+        # Use the agent's query method directly, forcing graph query type (in a worker thread, it blocks)
+        result = await anyio.to_thread.run_sync(agent.query, query, "GRAPH_QUERY")
         
         # FIXED: Ensure we're getting graph results from Neo4j
-        if result.get('database_used') in ['neo4j', 'neo4j_fallback']:
+        if result.get('database_used') in GRAPH_DATABASES:
             return {
                 'result': result.get('result', 'No graph analysis results found'),
                 'database_used': result.get('database_used', 'neo4j'),
@@ -2913,12 +3380,12 @@ async def graph_analysis(query: str, agent) -> Dict[str, Any]:
             }
         else:
             # Force graph search if agent didn't use Neo4j
-            logger.warning(f"Agent used {result.get('database_used')} instead of Neo4j, forcing graph search")
+            logger.warning("Agent used %s instead of Neo4j, forcing graph search", result.get('database_used'))
             
             # Try to access Neo4j retriever directly
-            if hasattr(agent, 'neo4j_retriever') and agent.neo4j_retriever:
+            if agent.neo4j_retriever is not None:
                 # Get documents directly from Neo4j
-                docs = agent.neo4j_retriever._get_relevant_documents(query)
+                docs = await anyio.to_thread.run_sync(agent.neo4j_retriever._get_relevant_documents, query)
                 
                 if docs:
                     # Format the documents into a readable result
@@ -2946,7 +3413,7 @@ async def graph_analysis(query: str, agent) -> Dict[str, Any]:
                 raise Exception("Neo4j retriever not available")
                 
     except Exception as e:
-        logger.error(f"Error in graph analysis: {e}")
+        logger.error("Error in graph analysis: %s", e)
         return {
             'result': f'Graph analysis failed: {str(e)}',
             'database_used': 'none',
@@ -2956,6 +3423,16 @@ async def graph_analysis(query: str, agent) -> Dict[str, Any]:
             'error': str(e)
         }
 
+# analysis_type -> (runner, retriever attribute the agent must have). auto lets the agent's
+# classifier route; explicit types are forced into the agent so it skips the classifier
+# LLM call. Every runner shares config.analysis_timeout.
+ANALYSIS_DISPATCH = {
+    "auto": (agent_analysis, None),
+    "hybrid": (partial(agent_analysis, forced_type="HYBRID_QUERY"), None),
+    "semantic": (semantic_analysis, "milvus_retriever"),
+    "graph": (graph_analysis, "neo4j_retriever"),
+}
+
 async def pattern_analysis(query: str) -> Dict[str, Any]:
     """Check for known patterns and quick responses."""
     try:
@@ -2964,21 +3441,27 @@ async def pattern_analysis(query: str) -> Dict[str, Any]:
             return {"type": "pattern", "result": result}
         return {"type": "pattern", "result": None}
     except Exception as e:
-        logger.error(f"Pattern analysis error: {e}")
+        logger.error("Pattern analysis error: %s", e)
         return {"type": "pattern", "error": str(e)}
 
 # Run the server
 if __name__ == "__main__":
-    logger.info(f"Starting Mistral Security Analysis API on {config.api_host}:{config.api_port}")
-    logger.info(f"Environment: {config.environment}")
-    logger.info(f"Startup mode: {os.getenv('STARTUP_MODE', 'normal')}")
-    logger.info(f"Lightweight mode: {config.lightweight_mode}")
+    logger.info("Starting Mistral Security Analysis API on %s:%s", config.api_host, config.api_port)
+    logger.info("Environment: %s", config.environment)
+    logger.info("Startup mode: %s", os.getenv('STARTUP_MODE', 'normal'))
+    logger.info("Lightweight mode: %s", config.lightweight_mode)
+    logger.info("Workers: %s", config.workers)
     
     uvicorn.run(
-        app,  # Use the app directly instead of string reference
+        # Multiple workers need an import string; a single worker uses the app directly
+        "api_server:app" if config.workers > 1 else app,
         host=config.api_host,
         port=config.api_port,
         reload=False,  # Disable reload in Docker to prevent issues
+        workers=config.workers,
+        loop="auto",  # uvloop when installed (not on Windows), asyncio otherwise
+        http="httptools",  # C HTTP parser instead of h11
         log_level=config.log_level.lower(),
-        access_log=True
-    ) 
\ No newline at end of file
+        access_log=config.access_log,  # ACCESS_LOG=true to re-enable
+        proxy_headers=config.proxy_headers  # PROXY_HEADERS=true when behind a reverse proxy
+    )
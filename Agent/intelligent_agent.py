@@ -163,19 +163,22 @@ Cypher query (only the code, no explanations):
     def generate(self, query: str) -> str:
         prompt = self.prompt_template.format(query=query)
         try:
-            logger.info(f"Generating Cypher for query: {query}")
+            logger.info("Generating Cypher for query: %s", query)
             cypher = self.llm.invoke(prompt).strip()
-            logger.info(f"LLM generated Cypher: {cypher}")
+            logger.info("LLM generated Cypher: %s", cypher)
             if not cypher.lower().startswith("match"):
-                logger.warning(f"Invalid Cypher generated (doesn't start with MATCH): {cypher}")
+                logger.warning("Invalid Cypher generated (doesn't start with MATCH): %s", cypher)
                 raise ValueError("Invalid Cypher generated")
             return cypher
         except Exception as e:
-            logger.error(f"Error in Cypher generation: {e}")
+            logger.error("Error in Cypher generation: %s", e)
             fallback = "MATCH (n) RETURN n LIMIT 5"
-            logger.info(f"Using fallback Cypher: {fallback}")
+            logger.info("Using fallback Cypher: %s", fallback)
             return fallback
 
+# Query categories produced by QueryClassifier
+QUERY_TYPES = ("CONVERSATIONAL", "GRAPH_QUERY", "SEMANTIC_QUERY", "HYBRID_QUERY")
+
 class QueryClassifier:
     """Classifies queries to determine which database to use and whether they need database retrieval at all."""
     
@@ -213,14 +216,14 @@ class QueryClassifier:
                 self.classification_prompt.format(query=query)
             )
             classification = response.strip().upper()
-            if classification in ["CONVERSATIONAL", "GRAPH_QUERY", "SEMANTIC_QUERY", "HYBRID_QUERY"]:
-                logger.debug(f"Query classified as: {classification}")
+            if classification in QUERY_TYPES:
+                logger.debug("Query classified as: %s", classification)
                 return classification
             else:
-                logger.warning(f"Unclear classification: {classification}, defaulting to SEMANTIC_QUERY")
+                logger.warning("Unclear classification: %s, defaulting to SEMANTIC_QUERY", classification)
                 return "SEMANTIC_QUERY"
         except Exception as e:
-            logger.error(f"Error classifying query: {e}")
+            logger.error("Error classifying query: %s", e)
             return "SEMANTIC_QUERY"
 
 class Neo4jRetriever(BaseRetriever):
@@ -228,17 +231,20 @@ class Neo4jRetriever(BaseRetriever):
     
     # Use PrivateAttr for non-config attributes
     _driver: Any = PrivateAttr()
+    _database: Optional[str] = PrivateAttr()
     _cypher_generator: Any = PrivateAttr()
     
-    def __init__(self, uri: str, user: str, password: str, llm=None, **kwargs):
+    def __init__(self, uri: str, user: str, password: str, llm=None, database: Optional[str] = None, **kwargs):
         super().__init__(**kwargs)
+        # Sessions without an explicit database resolve the home database on every open
+        self._database = database
         try:
             self._driver = GraphDatabase.driver(uri, auth=(user, password))
-            with self._driver.session() as session:
+            with self._driver.session(database=self._database) as session:
                 session.run("RETURN 1")
             logger.info("Neo4j connection established successfully")
         except Exception as e:
-            logger.error(f"Failed to connect to Neo4j: {e}")
+            logger.error("Failed to connect to Neo4j: %s", e)
             raise
 
         if llm is None:
@@ -253,27 +259,23 @@ class Neo4jRetriever(BaseRetriever):
     def _get_relevant_documents(self, query: str, *, run_manager=None) -> List[Document]:
         """Retrieve relevant documents from Neo4j based on the query."""
         try:
-            logger.info(f"Starting Neo4j query for: {query}")
-            logger.info(f"run_manager type: {type(run_manager)}")
-            logger.info(f"run_manager value: {run_manager}")
+            logger.debug("Starting Neo4j query for: %s", query)
             
-            with self.driver.session() as session:
+            with self.driver.session(database=self._database) as session:
                 # Convert natural language query to Cypher
                 cypher_query, parameters = self._query_to_cypher(query)
-                logger.debug(f"Executing Cypher query: {cypher_query}")
-                
                 # Log the Cypher query
-                logger.info(f"Executing LLM-generated Cypher:\n{cypher_query}")
+                logger.info("Executing LLM-generated Cypher:\n%s", cypher_query)
 
                 
                 result = session.run(cypher_query, parameters)
                 
                 # Log the actual result structure for debugging
                 result_list = list(result)
-                logger.info(f"Query returned {len(result_list)} records")
-                if result_list:
-                    logger.info(f"Sample record keys: {list(result_list[0].keys())}")
-                    logger.info(f"Sample record values: {dict(result_list[0])}")
+                logger.info("Query returned %d records", len(result_list))
+                if result_list and logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("Sample record keys: %s", list(result_list[0].keys()))
+                    logger.debug("Sample record values: %s", dict(result_list[0]))
                 result = result_list  # Convert to list since we consumed the result
                 
                 documents = []
@@ -289,11 +291,11 @@ class Neo4jRetriever(BaseRetriever):
                     }
                     documents.append(Document(page_content=content, metadata=metadata))
                 
-                logger.info(f"Retrieved {len(documents)} documents from Neo4j")
+                logger.info("Retrieved %s documents from Neo4j", len(documents))
                 
                 return documents
         except Exception as e:
-            logger.error(f"Error querying Neo4j: {e}")
+            logger.error("Error querying Neo4j: %s", e)
             return []
     #Now relies on the LLM to generate the Cypher query, ignoring the hardcoded logic
     def _query_to_cypher(self, query: str) -> tuple[str, dict]:
@@ -306,14 +308,11 @@ class Neo4jRetriever(BaseRetriever):
         try:
             logger.info("About to call cypher_generator.generate()")
             cypher_query = self._cypher_generator.generate(query)
-            logger.info(f"Successfully generated Cypher: {cypher_query}")
+            logger.info("Successfully generated Cypher: %s", cypher_query)
             # LLM returns plain Cypher, so no parameters expected
             return cypher_query, {}
         except Exception as e:
-            logger.error(f"Exception in _query_to_cypher: {e}")
-            logger.error(f"Exception type: {type(e)}")
-            import traceback
-            logger.error(f"Traceback: {traceback.format_exc()}")
+            logger.exception("Exception in _query_to_cypher (%s): %s", type(e).__name__, e)
             return "MATCH (n) RETURN n LIMIT 5", {}
 
     
@@ -436,8 +435,8 @@ class Neo4jRetriever(BaseRetriever):
                 return json.dumps(record_dict, indent=2)
                 
         except Exception as e:
-            logger.error(f"Error formatting Neo4j result: {e}")
-            logger.error(f"Record: {record_dict}")
+            logger.error("Error formatting Neo4j result: %s", e)
+            logger.error("Record: %s", record_dict)
             return f"Raw result: {json.dumps(record_dict, default=str)}"
     
     async def _aget_relevant_documents(self, query: str, *, run_manager=None):
@@ -454,7 +453,7 @@ class MilvusRetriever(BaseRetriever):
         super().__init__(**kwargs)
         self._vectorstore = vectorstore
         self._k = k
-        logger.info(f"Initialized MilvusRetriever with k={k}")
+        logger.info("Initialized MilvusRetriever with k=%s", k)
     
     @property
     def vectorstore(self):
@@ -472,10 +471,10 @@ class MilvusRetriever(BaseRetriever):
             for doc in docs:
                 doc.metadata["source"] = "milvus"
                 doc.metadata["query_type"] = "semantic"
-            logger.info(f"Retrieved {len(docs)} documents from Milvus")
+            logger.info("Retrieved %s documents from Milvus", len(docs))
             return docs
         except Exception as e:
-            logger.error(f"Error querying Milvus: {e}")
+            logger.error("Error querying Milvus: %s", e)
             return []
     
     async def _aget_relevant_documents(self, query: str, *, run_manager=None):
@@ -510,14 +509,14 @@ class MultiCollectionMilvusRetriever(BaseRetriever):
                     vectorstore.similarity_search("test", k=1)
                     self._collections[collection_name] = vectorstore
                     successful_connections += 1
-                    logger.info(f"Connected to Milvus collection: {collection_name}")
+                    logger.info("Connected to Milvus collection: %s", collection_name)
                 except Exception as e:
-                    logger.warning(f"Failed to connect to collection {collection_name}: {e}")
+                    logger.warning("Failed to connect to collection %s: %s", collection_name, e)
             
             if successful_connections == 0:
                 logger.error("Failed to connect to any Milvus collections")
             else:
-                logger.info(f"Successfully connected to {successful_connections}/{len(collections)} collections")
+                logger.info("Successfully connected to %s/%s collections", successful_connections, len(collections))
     
     @property
     def collections(self):
@@ -549,12 +548,12 @@ class MultiCollectionMilvusRetriever(BaseRetriever):
                         doc.metadata["data_type"] = "network_flows"
                 
                 all_docs.extend(docs)
-                logger.debug(f"Found {len(docs)} results from {collection_name}")
+                logger.debug("Found %s results from %s", len(docs), collection_name)
                 
             except Exception as e:
-                logger.error(f"Error querying collection {collection_name}: {e}")
+                logger.error("Error querying collection %s: %s", collection_name, e)
         
-        logger.info(f"Retrieved total of {len(all_docs)} documents from {len(self._collections)} collections")
+        logger.info("Retrieved total of %s documents from %s collections", len(all_docs), len(self._collections))
         return all_docs
     
     async def _aget_relevant_documents(self, query: str, *, run_manager=None):
@@ -589,19 +588,19 @@ class HybridRetriever(BaseRetriever):
         try:
             neo4j_docs = self.neo4j_retriever._get_relevant_documents(query, run_manager=run_manager)
         except Exception as e:
-            logger.error(f"Error retrieving from Neo4j in hybrid query: {e}")
+            logger.error("Error retrieving from Neo4j in hybrid query: %s", e)
         
         try:
             milvus_docs = self.milvus_retriever._get_relevant_documents(query, run_manager=run_manager)
         except Exception as e:
-            logger.error(f"Error retrieving from Milvus in hybrid query: {e}")
+            logger.error("Error retrieving from Milvus in hybrid query: %s", e)
         
         # Combine and add hybrid metadata
         combined_docs = neo4j_docs + milvus_docs
         for doc in combined_docs:
             doc.metadata["query_type"] = "hybrid"
         
-        logger.info(f"Hybrid retrieval: {len(neo4j_docs)} Neo4j + {len(milvus_docs)} Milvus = {len(combined_docs)} total")
+        logger.info("Hybrid retrieval: %s Neo4j + %s Milvus = %s total", len(neo4j_docs), len(milvus_docs), len(combined_docs))
         return combined_docs
     
     async def _aget_relevant_documents(self, query: str, *, run_manager=None):
@@ -616,6 +615,7 @@ class IntelligentSecurityAgent:
                  neo4j_uri: str = None,
                  neo4j_user: str = None,
                  neo4j_password: str = None,
+                 neo4j_database: str = None,
                  collection_name: Optional[str] = None):
         
         # Use environment variables with fallbacks
@@ -624,6 +624,7 @@ class IntelligentSecurityAgent:
         self.neo4j_uri = neo4j_uri or os.getenv("NEO4J_URI", "bolt://localhost:7687")
         self.neo4j_user = neo4j_user or os.getenv("NEO4J_USER", "neo4j")
         self.neo4j_password = neo4j_password or os.getenv("NEO4J_PASSWORD", "password123")
+        self.neo4j_database = neo4j_database or os.getenv("NEO4J_DATABASE", "neo4j")
         
         logger.info("Initializing Intelligent Security Agent")
         
@@ -636,7 +637,7 @@ class IntelligentSecurityAgent:
             )
             logger.info("LLM initialized successfully")
         except Exception as e:
-            logger.error(f"Failed to initialize LLM: {e}")
+            logger.error("Failed to initialize LLM: %s", e)
             raise
         
         # Initialize query classifier
@@ -651,15 +652,15 @@ class IntelligentSecurityAgent:
             cache_dir = os.getenv("MODEL_CACHE_DIR", "/srv/homedir/mistral-app/model-cache")
             if os.path.exists(cache_dir) and os.access(cache_dir, os.W_OK):
                 model_kwargs['cache_folder'] = f"{cache_dir}/sentence-transformers"
-                logger.info(f"Using network storage for model cache: {cache_dir}")
+                logger.info("Using network storage for model cache: %s", cache_dir)
             
             self.embeddings = HuggingFaceEmbeddings(
                 model_name=model_name,
                 model_kwargs=model_kwargs
             )
-            logger.info(f"Optimized embeddings model loaded: {model_name}")
+            logger.info("Optimized embeddings model loaded: %s", model_name)
         except Exception as e:
-            logger.error(f"Failed to load embeddings model: {e}")
+            logger.error("Failed to load embeddings model: %s", e)
             raise
         
         # Connect to Milvus
@@ -678,9 +679,9 @@ class IntelligentSecurityAgent:
                     connection_args={"uri": f"http://{self.milvus_host}:{self.milvus_port}"},
                 )
                 self.milvus_retriever = MilvusRetriever(self.milvus_vectorstore)
-                logger.info(f"Using single collection: {collection_name}")
+                logger.info("Using single collection: %s", collection_name)
             except Exception as e:
-                logger.error(f"Failed to initialize single collection retriever: {e}")
+                logger.error("Failed to initialize single collection retriever: %s", e)
         else:
             # Use multi-collection retriever for comprehensive search
             try:
@@ -693,7 +694,7 @@ class IntelligentSecurityAgent:
                 )
                 logger.info("Using multi-collection retriever")
             except Exception as e:
-                logger.error(f"Failed to initialize multi-collection retriever: {e}")
+                logger.error("Failed to initialize multi-collection retriever: %s", e)
         
         # Initialize Neo4j retriever
         try:
@@ -701,10 +702,11 @@ class IntelligentSecurityAgent:
                 self.neo4j_uri,
                 self.neo4j_user,
                 self.neo4j_password,
-                llm=self.llm  # pass the LLM here
+                llm=self.llm,  # pass the LLM here
+                database=self.neo4j_database
             )
         except Exception as e:
-            logger.error(f"Failed to initialize Neo4j retriever: {e}")
+            logger.error("Failed to initialize Neo4j retriever: %s", e)
             self.neo4j_retriever = None
         
         # Initialize hybrid retriever
@@ -713,30 +715,59 @@ class IntelligentSecurityAgent:
                 self.hybrid_retriever = HybridRetriever(self.neo4j_retriever, self.milvus_retriever)
                 logger.info("Hybrid retriever initialized")
             except Exception as e:
-                logger.error(f"Failed to initialize hybrid retriever: {e}")
+                logger.error("Failed to initialize hybrid retriever: %s", e)
                 self.hybrid_retriever = None
         else:
             self.hybrid_retriever = None
             logger.warning("Hybrid retriever not available due to missing component retrievers")
+        
+        # RetrievalQA chains per route, built once here so no query pays for chain construction
+        self._qa_chains = {
+            route: self._build_qa_chain(retriever)
+            for route, retriever in (
+                ("neo4j", self.neo4j_retriever),
+                ("milvus", self.milvus_retriever),
+                ("hybrid", self.hybrid_retriever),
+            )
+            if retriever is not None
+        }
     
     def _connect_milvus(self, host: str, port: int):
         """Connect to Milvus with retry logic and better error handling."""
-        logger.info(f"Connecting to Milvus at {host}:{port}")
+        logger.info("Connecting to Milvus at %s:%s", host, port)
         for attempt in range(30):
             try:
                 connections.connect("default", host=host, port=port)
                 logger.info("Successfully connected to Milvus")
                 break
             except Exception as e:
-                logger.warning(f"Connection attempt {attempt + 1}/30 failed: {e}")
+                logger.warning("Connection attempt %s/30 failed: %s", attempt + 1, e)
                 if attempt < 29:
                     time.sleep(2)
                 else:
                     logger.error("Could not connect to Milvus after 30 attempts")
                     raise
     
-    def query(self, question: str) -> Dict[str, Any]:
-        """Main query method that routes to appropriate database with improved error handling."""
+    def _build_qa_chain(self, retriever) -> RetrievalQA:
+        """Build the RetrievalQA chain for a retriever.
+        
+        The chains hold no per-query state, so one chain per retriever is reused
+        instead of going through from_chain_type() on every query.
+        """
+        # Use custom conversation-aware prompt for better memory
+        return RetrievalQA.from_chain_type(
+            llm=self.llm,
+            retriever=retriever,
+            return_source_documents=True,
+            chain_type_kwargs={"prompt": CONVERSATION_AWARE_PROMPT}
+        )
+    
+    def query(self, question: str, forced_type: Optional[str] = None) -> Dict[str, Any]:
+        """Main query method that routes to appropriate database with improved error handling.
+        
+        Passing forced_type (GRAPH_QUERY, SEMANTIC_QUERY, HYBRID_QUERY or CONVERSATIONAL)
+        skips the LLM classifier call and routes the query directly.
+        """
         
         if not question or not question.strip():
             return {
@@ -746,13 +777,17 @@ class IntelligentSecurityAgent:
                 "error": "Empty or invalid query"
             }
         
-        # Classify the query
-        try:
-            query_type = self.classifier.classify_query(question)
-            logger.info(f"Query classified as: {query_type}")
-        except Exception as e:
-            logger.error(f"Error in query classification: {e}")
-            query_type = "SEMANTIC_QUERY"
+        # Classify the query unless the caller already decided the route
+        if forced_type in QUERY_TYPES:
+            query_type = forced_type
+            logger.info("Query type forced to: %s", query_type)
+        else:
+            try:
+                query_type = self.classifier.classify_query(question)
+                logger.info("Query classified as: %s", query_type)
+            except Exception as e:
+                logger.error("Error in query classification: %s", e)
+                query_type = "SEMANTIC_QUERY"
         
         # Handle conversational queries without database retrieval
         if query_type == "CONVERSATIONAL":
@@ -769,7 +804,7 @@ class IntelligentSecurityAgent:
                     "source_documents": []  # No documents for conversational queries
                 }
             except Exception as e:
-                logger.error(f"Error processing conversational query: {e}")
+                logger.error("Error processing conversational query: %s", e)
                 return {
                     "result": f"Error processing conversational query: {str(e)}",
                     "query_type": query_type,
@@ -813,14 +848,8 @@ class IntelligentSecurityAgent:
         
         # Execute security query with database retrieval
         try:
-            # Use custom conversation-aware prompt for better memory
-            qa_chain = RetrievalQA.from_chain_type(
-                llm=self.llm,
-                retriever=retriever,
-                return_source_documents=True,
-                chain_type_kwargs={"prompt": CONVERSATION_AWARE_PROMPT}
-            )
-            
+            # Fallbacks reuse their retriever's regular route chain
+            qa_chain = self._qa_chains[retriever_name.removesuffix("_fallback")]
             result = qa_chain.invoke({"query": question})
             
             # Add metadata about the routing decision
@@ -843,11 +872,11 @@ class IntelligentSecurityAgent:
             else:
                 result["database_used"] = retriever_name
             
-            logger.info(f"Query processed successfully using {result.get('database_used')}")
+            logger.info("Query processed successfully using %s", result.get('database_used'))
             return result
             
         except Exception as e:
-            logger.error(f"Error executing query: {e}")
+            logger.error("Error executing query: %s", e)
             return {
                 "result": f"Error processing query: {str(e)}",
                 "query_type": query_type,
@@ -859,11 +888,11 @@ class IntelligentSecurityAgent:
         """Clean up connections with proper error handling."""
         logger.info("Closing agent connections")
         try:
-            if hasattr(self, 'neo4j_retriever') and self.neo4j_retriever:
+            if self.neo4j_retriever is not None:
                 self.neo4j_retriever.driver.close()
                 logger.info("Neo4j connection closed")
         except Exception as e:
-            logger.error(f"Error closing Neo4j connection: {e}")
+            logger.error("Error closing Neo4j connection: %s", e)
 
 def main():
     """Main function to run the intelligent agent with improved error handling."""
@@ -886,7 +915,7 @@ def main():
                 if not question:
                     continue
                 
-                logger.info(f"Processing question: {question}")
+                logger.info("Processing question: %s", question)
                 result = agent.query(question)
                 
                 print(f"\n=== Analysis Results ===")
@@ -934,12 +963,12 @@ def main():
                 print("\n\nStopping agent...")
                 break
             except Exception as e:
-                logger.error(f"Error in main loop: {e}")
+                logger.error("Error in main loop: %s", e)
                 print(f"\nError: {e}")
                 print("Please try a different question or check your database connections.")
         
     except Exception as e:
-        logger.error(f"Fatal error: {e}")
+        logger.error("Fatal error: %s", e)
         print(f"Failed to initialize agent: {e}")
         return 1
     
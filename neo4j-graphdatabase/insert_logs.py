@@ -104,7 +104,7 @@ class Neo4jFlowIngester:
     def close(self):
         self.driver.close()
 
-    # Create constraints to ensure unique keys in Neo4j
+    # Create constraints to ensure unique keys in Neo4j (plus the flow timestamp index used by the heatmap)
     def create_constraints(self):
         with self.driver.session() as session:
             session.run("CREATE CONSTRAINT host_ip IF NOT EXISTS FOR (h:Host) REQUIRE h.ip IS UNIQUE")
@@ -112,6 +112,7 @@ class Neo4jFlowIngester:
             session.run("CREATE CONSTRAINT flow_id IF NOT EXISTS FOR (f:Flow) REQUIRE f.flowId IS UNIQUE")
             session.run("CREATE CONSTRAINT file_name IF NOT EXISTS FOR (pf:ProcessedFile) REQUIRE pf.name IS UNIQUE")
             session.run("CREATE CONSTRAINT proto_name IF NOT EXISTS FOR (proto:Protocol) REQUIRE proto.name IS UNIQUE")
+            session.run("CREATE INDEX flow_start_ms IF NOT EXISTS FOR (f:Flow) ON (f.flowStartMilliseconds)")
 
     # Check if a flow is valid (for honeypot or netflow schema)
     def is_valid_flow(self, flow):